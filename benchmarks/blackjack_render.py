@@ -0,0 +1,155 @@
+"""Benchmark of the blackjack table renderer.
+
+Renders realistic blackjack frames, built from the real deck and hand logic of `utils.blackjack`, without Discord.
+Each executor mode and encoding option runs in its own process so that peak RSS is measured per case.
+
+Run it from the repository root (the renderer loads its assets relative to the working directory):
+
+    python -m benchmarks.blackjack_render --frames 300 --workers 4
+"""
+import argparse
+import concurrent.futures
+import copy
+import multiprocessing
+import os
+import random
+import resource
+import time
+from typing import Dict, Any, List, Tuple
+
+from utils.blackjack import BlackjackGame, Card, Player, SUITS
+
+EXECUTOR_MODES = ["inline", "thread", "process"]
+
+ENCODINGS = {
+    "png": ("png", {}),
+    "png_fast": ("png", {"compress_level": 1}),
+    "png_optimize": ("png", {"optimize": True}),
+    "webp": ("webp", {"quality": 80}),
+    "webp_lossless": ("webp", {"lossless": True}),
+}
+
+Frame = List[List[Card]]
+
+
+def _snapshot(players: List[Player]) -> Frame:
+    return [[copy.copy(card) for card in player.hand] for player in players]
+
+
+def generate_frames(count: int, seed: int = 0) -> List[Frame]:
+    """Plays blackjack games with the real deck logic and keeps every table the bot would have rendered."""
+    rng = random.Random(seed)
+    frames: List[Frame] = []
+
+    while len(frames) < count:
+        deck = [Card(suit, value) for value in range(2, 15) for suit in SUITS]
+        rng.shuffle(deck)
+
+        player = Player()
+        dealer = Player(dealer=True)
+        player.add_card(deck.pop())
+        player.add_card(deck.pop())
+        dealer.add_card(deck.pop())
+        dealer.add_card(deck.pop().flip())
+        frames.append(_snapshot([player, dealer]))
+
+        # Players hit below 12, stay from 17 and are undecided in between.
+        while player.score < 12 or (player.score < 17 and rng.random() < 0.5):
+            player.add_card(deck.pop())
+            frames.append(_snapshot([player, dealer]))
+
+        dealer.hand[1].flip()
+        dealer.calculate_hand()
+        if player.score <= 21:
+            while dealer.score < 17:
+                dealer.add_card(deck.pop())
+        frames.append(_snapshot([player, dealer]))
+
+    return frames[:count]
+
+
+def _render_frame(frame: Frame, encoding: str) -> int:
+    image_format, save_options = ENCODINGS[encoding]
+    return len(BlackjackGame.render(frame, image_format, **save_options).getbuffer())
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux.
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024
+
+
+def run_case(mode: str, encoding: str, frames: List[Frame], workers: int) -> Dict[str, Any]:
+    """Renders every frame with the given executor mode and encoding, and returns the measurements."""
+    start = time.perf_counter()
+
+    if mode == "inline":
+        workers = 1
+        sizes = [_render_frame(frame, encoding) for frame in frames]
+    else:
+        executor_cls = concurrent.futures.ThreadPoolExecutor if mode == "thread" \
+            else concurrent.futures.ProcessPoolExecutor
+        with executor_cls(max_workers=workers) as executor:
+            sizes = list(executor.map(_render_frame, frames, [encoding] * len(frames)))
+
+    elapsed = time.perf_counter() - start
+    fps = len(frames) / elapsed
+    cores = min(workers, os.cpu_count() or 1)
+
+    return {
+        "mode": mode,
+        "encoding": encoding,
+        "frames": len(frames),
+        "workers": workers,
+        "fps": fps,
+        "fps_per_core": fps / cores,
+        "bytes_per_frame": sum(sizes) / len(sizes),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _run_case_isolated(queue: multiprocessing.Queue, mode: str, encoding: str, count: int, seed: int,
+                       workers: int) -> None:
+    frames = generate_frames(count, seed)
+    # Warm up the asset loading before timing.
+    _render_frame(frames[0], encoding)
+    queue.put(run_case(mode, encoding, frames, workers))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the blackjack table renderer.")
+    parser.add_argument("--frames", type=int, default=200, help="frames rendered per case")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="executor workers")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the dealt games")
+    parser.add_argument("--modes", nargs="+", choices=EXECUTOR_MODES, default=EXECUTOR_MODES)
+    parser.add_argument("--encodings", nargs="+", choices=list(ENCODINGS), default=list(ENCODINGS))
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results: List[Tuple[str, ...]] = []
+
+    for mode in args.modes:
+        for encoding in args.encodings:
+            queue = context.Queue()
+            process = context.Process(
+                target=_run_case_isolated, args=(queue, mode, encoding, args.frames, args.seed, args.workers)
+            )
+            process.start()
+            result = queue.get()
+            process.join()
+
+            results.append((
+                result["mode"], result["encoding"], str(result["workers"]), f"{result['fps']:.1f}",
+                f"{result['fps_per_core']:.1f}", f"{result['bytes_per_frame'] / 1024:.1f}",
+                f"{result['peak_rss_mb']:.1f}"
+            ))
+
+    header = ("mode", "encoding", "workers", "fps", "fps/core", "KiB/frame", "peak RSS MiB")
+    widths = [max(len(row[i]) for row in results + [header]) for i in range(len(header))]
+    for row in [header] + results:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,17 @@
 import datetime
-import traceback
+import io
+import time
+from typing import Any, Dict
 
 import discord
 from discord import app_commands
 from discord.ext import commands, tasks
 
 import utils.errors as errors
+import utils.maintenance as maintenance
 from cryptomc import CryptoMC
+from utils.responder import close, send
+from utils.startup import startup_report
 
 
 class Bot(commands.Cog):
@@ -18,31 +23,171 @@ class Bot(commands.Cog):
 
     async def cog_load(self) -> None:
         self.update_presence.start()
+        self.send_error_digest.change_interval(seconds=self.client.config.get("errors", {}).get("digest_interval", 300))
+        self.send_error_digest.start()
 
     async def cog_unload(self) -> None:
         self.update_presence.stop()
+        self.send_error_digest.stop()
 
-    @tasks.loop(minutes=5)
-    async def update_presence(self) -> None:
-        pipeline = [{"$match": {"bank": {"$exists": True}}}, {"$project": {"bank": 1}}, {"$sort": {"bank": -1}},
-                    {"$limit": 1}]
-        cursor = self.client.mongo.db["user"].aggregate(pipeline)
-        leaderboard_list = await cursor.to_list(None)
+    PRESENCE_KEY = "cryptomc_presence"
+
+    async def _publish_presence(self) -> None:
+        leaderboard_list = await self.client.mongo.fetch_leaderboard(1)
 
         if len(leaderboard_list) == 0:
             return
 
         best_user_data = leaderboard_list[0]
+        # In a cluster, the user may only be cached by the process of another shard.
         best_user = self.client.get_user(int(best_user_data["_id"]))
         if best_user is None:
+            try:
+                best_user = await self.client.fetch_user(int(best_user_data["_id"]))
+            except discord.NotFound:
+                return
+
+        await self.client.redis.set(self.PRESENCE_KEY, f"{best_user} avec {best_user_data['bank']:,} $LLC")
+
+    @tasks.loop(minutes=5)
+    async def update_presence(self) -> None:
+        # The leader of the cluster picks the presence, every process shows it on its own shards.
+        if self.client.leadership.leader:
+            await self._publish_presence()
+
+        presence = await self.client.redis.get(self.PRESENCE_KEY)
+        if presence is None:
             return
 
         await self.client.change_presence(
-            activity=discord.Activity(
-                type=discord.ActivityType.watching, name=f"{best_user} avec {best_user_data['bank']:,} $LLC"
-            )
+            activity=discord.Activity(type=discord.ActivityType.watching, name=presence)
         )
 
+    @update_presence.before_loop
+    async def before_update_presence(self) -> None:
+        await self.client.wait_until_ready()
+
+    @tasks.loop(minutes=5)
+    async def send_error_digest(self) -> None:
+        digest = self.client.reporter.digest()
+        if digest is None:
+            return
+
+        try:
+            owner = self.client.get_user(self.client.owner_id) or await self.client.fetch_user(self.client.owner_id)
+            await owner.send(digest)
+        except discord.HTTPException:
+            # The errors are kept for the next digest, and the loop keeps running.
+            return
+
+        self.client.reporter.acknowledge()
+
+    @send_error_digest.before_loop
+    async def before_send_error_digest(self) -> None:
+        await self.client.wait_until_ready()
+
+    def _record_command(self, interaction: discord.Interaction, error: Exception = None) -> None:
+        if interaction.command is None or "started_at" not in interaction.extras:
+            return
+
+        self.client.recorder.finish(interaction, error)
+
+        command = interaction.command.qualified_name
+        self.client.metrics.observe(
+            "cryptomc_command_seconds", time.perf_counter() - interaction.extras["started_at"], command=command
+        )
+        if error is not None:
+            self.client.metrics.inc("cryptomc_command_errors_total", command=command, error=type(error).__name__)
+
+    @commands.command(name="metrics")
+    @commands.is_owner()
+    async def metrics(self, ctx: commands.Context) -> None:
+        await ctx.send(file=discord.File(io.BytesIO(self.client.metrics.render().encode()), filename="metrics.txt"))
+
+    @commands.command(name="startup")
+    @commands.is_owner()
+    async def startup(self, ctx: commands.Context) -> None:
+        await ctx.send(f"```\n{startup_report.format()}\n```")
+
+    @commands.command(name="traces")
+    @commands.is_owner()
+    async def traces(self, ctx: commands.Context, path: str = "traces.json") -> None:
+        count = self.client.recorder.dump(path)
+        await ctx.send(f"{count} interactions écrites dans `{path}`.")
+
+    @commands.group(name="profiler", invoke_without_command=True)
+    @commands.is_owner()
+    async def profiler(self, ctx: commands.Context) -> None:
+        state = "en cours" if self.client.profiler.running else "arrêté"
+        await ctx.send(f"Profilage {state}, utilisez `;;profiler start` ou `;;profiler stop [fichier]`.")
+
+    @profiler.command(name="start")
+    @commands.is_owner()
+    async def profiler_start(self, ctx: commands.Context) -> None:
+        if self.client.profiler.running:
+            return await ctx.send("Le profilage est déjà en cours.")
+
+        self.client.profiler.start()
+        await ctx.send("Profilage démarré.")
+
+    @profiler.command(name="stop")
+    @commands.is_owner()
+    async def profiler_stop(self, ctx: commands.Context, path: str = "profile.collapsed") -> None:
+        if not self.client.profiler.running:
+            return await ctx.send("Le profilage n'est pas en cours.")
+
+        samples = self.client.profiler.stop(path)
+        await ctx.send(
+            f"{samples} échantillons écrits dans `{path}`, {len(self.client.profiler.stalls)} blocages de la boucle "
+            f"écrits dans `{path}.stalls.json`."
+        )
+
+    @commands.command(name="migrate")
+    @commands.is_owner()
+    async def migrate(self, ctx: commands.Context, migration: str, batch_size: int = 500,
+                      restart: bool = False) -> None:
+        if migration not in maintenance.MIGRATIONS:
+            return await ctx.send(f"Migrations disponibles: {', '.join(maintenance.MIGRATIONS)}.")
+
+        message = await ctx.send(f"Migration `{migration}` démarrée.")
+        last_edit = time.monotonic()
+
+        async def progress(state: Dict[str, Any]) -> None:
+            nonlocal last_edit
+            if state["done"] or time.monotonic() - last_edit > 5:
+                last_edit = time.monotonic()
+                await message.edit(content=maintenance.format_progress(state))
+
+        await maintenance.run_migration(
+            self.client.mongo.db, migration, self.client.mongo.DEFAULT_USER_DATA, self.client.config["guild_id"],
+            batch_size, restart, progress
+        )
+
+    @commands.command(name="snapshot")
+    @commands.is_owner()
+    async def snapshot(self, ctx: commands.Context, out: str = "snapshots") -> None:
+        # NumPy is only needed by the snapshots, it is not imported at startup.
+        startup_report.import_module("numpy")
+        snapshot = startup_report.import_module("utils.snapshot")
+
+        directory = await snapshot.export(self.client.mongo.db, list(self.client.mongo.DEFAULT_USER_DATA), out)
+        await ctx.send(f"Instantané de l'économie écrit dans `{directory}`.")
+
+    @commands.command(name="reload")
+    @commands.is_owner()
+    async def reload(self, ctx: commands.Context) -> None:
+        timings = await self.client.reload_modules()
+        if not timings:
+            return await ctx.send("Aucun module n'a changé.")
+
+        report = "\n".join(f"`{module}`: {seconds * 1000:.1f}ms" for module, seconds in timings.items())
+        await ctx.send(f"Modules rechargés en {sum(timings.values()) * 1000:.1f}ms:\n{report}")
+
+    @commands.Cog.listener()
+    async def on_app_command_completion(self, interaction: discord.Interaction, command: app_commands.Command) -> None:
+        close(interaction)
+        self._record_command(interaction)
+
     @commands.Cog.listener()
     async def on_command_error(self, ctx: commands.Context, error: commands.CommandError) -> None:
         error = getattr(error, "original", error)
@@ -54,46 +199,42 @@ class Bot(commands.Cog):
 
     async def on_app_command_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError) -> None:
         error = getattr(error, "original", error)
+        self._record_command(interaction, error)
 
         if isinstance(error, (app_commands.CommandNotFound, discord.HTTPException, discord.NotFound)):
+            close(interaction)
             return
 
         elif isinstance(error, (errors.CommandOnCooldown, app_commands.CommandOnCooldown)):
             retry = discord.utils.format_dt(discord.utils.utcnow() + datetime.timedelta(seconds=error.retry_after), "R")
-            await interaction.response.send_message(
-                f"Vous êtes encore en cooldown pour cette commande, merci de réessayer {retry}.", ephemeral=True
+            await send(
+                interaction, f"Vous êtes encore en cooldown pour cette commande, merci de réessayer {retry}.",
+                ephemeral=True
             )
 
         elif isinstance(error, errors.InvalidAmount):
-            await interaction.response.send_message("Votre mise ne peut pas être inférieure à 1.", ephemeral=True)
+            await send(interaction, "Votre mise ne peut pas être inférieure à 1.", ephemeral=True)
 
         elif isinstance(error, errors.NotEnoughFunds):
-            await interaction.response.send_message(
-                "Vous n'avez pas assez d'argent sur votre compte bancaire.", ephemeral=True
+            await send(
+                interaction, "Vous n'avez pas assez d'argent sur votre compte bancaire.", ephemeral=True
             )
 
         elif isinstance(error, app_commands.CheckFailure):
+            close(interaction)
             return
 
         else:
-            await interaction.response.send_message(
+            # The error is only queued here, the owner receives it with the next digest.
+            command = interaction.command.qualified_name if interaction.command is not None else "?"
+            self.client.reporter.report(error, f"/{command}")
+
+            await send(
+                interaction,
                 "Nous sommes désolés mais une erreur inattendue s'est produite, le développeur du bot vient d'être "
                 "notifié.", ephemeral=True
             )
 
-            try:
-                etype, exc, trace = error
-            except TypeError:
-                etype = type(error)
-                exc = error
-                trace = error.__traceback__
-
-            formatted_error = "".join(traceback.format_exception(etype, exc, trace, 8))
-            formatted_error = f"```\n{formatted_error[:1950]}\n```"
-
-            owner = self.client.get_user(self.client.owner_id)
-            await owner.send(formatted_error)
-
 
 async def setup(client):
     await client.add_cog(Bot(client))
@@ -0,0 +1,137 @@
+import datetime
+
+from discord.ext import commands, tasks
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, OperationFailure, PyMongoError
+from redis.exceptions import RedisError
+
+from cryptomc import CryptoMC
+
+
+class Events(commands.Cog):
+    """The Cog to log every economy event and maintain their daily rollups."""
+
+    DUPLICATE_KEY = 11000
+
+    # Events younger than this are left to the next rollup, their batch may not be written yet.
+    ROLLUP_LAG = datetime.timedelta(minutes=1)
+
+    def __init__(self, client: CryptoMC):
+        self.client = client
+
+    async def cog_load(self) -> None:
+        self.flush.start()
+        self.rollup.start()
+
+    async def cog_unload(self) -> None:
+        self.rollup.cancel()
+        self.flush.cancel()
+        await self.client.events.write()
+
+    @property
+    def db(self):
+        # From the client of the bot, the MongoDB cog may already be unloaded when this one flushes its buffer.
+        return self.client.motor["cryptomc"]
+
+    async def _ensure_collections(self) -> None:
+        try:
+            await self.db.create_collection(
+                "events", timeseries={"timeField": "ts", "metaField": "meta", "granularity": "seconds"}
+            )
+        except CollectionInvalid:
+            pass
+        except OperationFailure:
+            # Time-series collections require MongoDB 5.0.
+            await self.db["events"].create_index("ts")
+
+    @tasks.loop(seconds=5)
+    async def flush(self) -> None:
+        await self.client.events.write()
+        try:
+            await self.client.events.publish_pending()
+        except RedisError:
+            pass
+
+    @flush.before_loop
+    async def before_flush(self) -> None:
+        await self.client.wait_until_ready()
+        await self._ensure_collections()
+
+    @tasks.loop(minutes=5)
+    async def rollup(self) -> None:
+        """Adds the events logged since the previous rollup to the per-day and per-game aggregates."""
+        if not self.client.leadership.leader:
+            return
+
+        try:
+            with self.client.metrics.timer("cryptomc_backend", backend="mongo", op="rollup_events"):
+                await self._rollup()
+        except (PyMongoError, RedisError):
+            # Retried with the same window by the next iteration.
+            pass
+
+    async def _rollup(self) -> None:
+        state = await self.db["rollups_state"].find_one({"_id": "daily"}) or {}
+        start = state.get("until", datetime.datetime.min)
+
+        # The window of an interrupted rollup is kept, so running it again cannot count an event twice.
+        until = state.get("pending")
+        if until is None:
+            until = datetime.datetime.utcnow() - self.ROLLUP_LAG
+
+            # An event requeued after a failed write keeps its timestamp, the window stops before it. MongoDB keeps
+            # milliseconds, so it stops one millisecond before.
+            oldest = await self.client.events.oldest_pending()
+            if oldest is not None:
+                until = min(until, oldest.replace(microsecond=oldest.microsecond // 1000 * 1000)
+                            - datetime.timedelta(milliseconds=1))
+            await self.db["rollups_state"].update_one({"_id": "daily"}, {"$set": {"pending": until}}, upsert=True)
+
+        group_id = {
+            "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$ts"}},
+            "kind": "$meta.kind",
+            "game": "$meta.game"
+        }
+        if self.client.guild_scoped:
+            group_id["guild_id"] = "$meta.guild_id"
+
+        pipeline = [
+            {"$match": {"ts": {"$gt": start, "$lte": until}}},
+            {"$group": {
+                "_id": group_id,
+                "count": {"$sum": 1},
+                "amount": {"$sum": "$amount"},
+                "won": {"$sum": {"$cond": [{"$eq": ["$won", True]}, 1, 0]}}
+            }}
+        ]
+        groups = await self.db["events"].aggregate(pipeline).to_list(None)
+
+        if groups:
+            # An aggregate records the last window added to it, and is not matched by that window again. The upsert
+            # then fails with a duplicate key, which means the window was already added.
+            try:
+                await self.db["rollups_daily"].bulk_write([
+                    UpdateOne(
+                        {"_id": group["_id"], "window": {"$ne": until}},
+                        {
+                            "$inc": {"count": group["count"], "amount": group["amount"], "won": group["won"]},
+                            "$set": {"window": until}
+                        },
+                        upsert=True
+                    ) for group in groups
+                ], ordered=False)
+            except BulkWriteError as e:
+                if any(error["code"] != self.DUPLICATE_KEY for error in e.details.get("writeErrors", [])):
+                    raise
+
+        await self.db["rollups_state"].update_one(
+            {"_id": "daily"}, {"$set": {"until": until}, "$unset": {"pending": ""}}, upsert=True
+        )
+
+    @rollup.before_loop
+    async def before_rollup(self) -> None:
+        await self.client.wait_until_ready()
+
+
+async def setup(client):
+    await client.add_cog(Events(client))
@@ -1,15 +1,17 @@
 import random
 
 import discord
-import numpy as np
 from discord import app_commands, ui
 from discord.app_commands import Choice
 from discord.ext import commands
 
+import utils.blackjack as blackjack
 import utils.errors as errors
 from cryptomc import CryptoMC
 from utils.blackjack import BlackjackGame
 from utils.checks import CooldownType, cooldown
+from utils.components import replay_button, static_view
+from utils.responder import arm, edit, send
 
 
 class CoinFlipConfirmationView(ui.View):
@@ -22,26 +24,29 @@ class CoinFlipConfirmationView(ui.View):
 
     async def _is_target(self, interaction: discord.Interaction) -> bool:
         if interaction.user.id != self.target.id:
-            await interaction.response.send_message("Cette demande de coinflip ne vous cible pas.", ephemeral=True)
+            await send(interaction, "Cette demande de coinflip ne vous cible pas.", ephemeral=True)
             return False
 
         return True
 
     @discord.ui.button(label="Accepter", emoji="✅", style=discord.ButtonStyle.green)
     async def accept(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        # The view's buttons are not dispatched by the bot, so they are armed here.
+        arm(interaction)
+
         if not await self._is_target(interaction):
             return
 
-        user_info = await interaction.client.mongo.fetch_user_data(self.author.id)
+        user_info = await interaction.client.mongo.fetch_user_data(self.author.id, interaction.guild_id)
         if user_info["bank"] < self.amount:
-            return await interaction.response.send_message(
-                f"{self.author.mention} n'a pas assez d'argent sur son compte bancaire.", ephemeral=True
+            return await send(
+                interaction, f"{self.author.mention} n'a pas assez d'argent sur son compte bancaire.", ephemeral=True
             )
 
-        target_info = await interaction.client.mongo.fetch_user_data(self.target.id)
+        target_info = await interaction.client.mongo.fetch_user_data(self.target.id, interaction.guild_id)
         if target_info["bank"] < self.amount:
-            return await interaction.response.send_message(
-                f"Vous n'avez pas assez d'argent sur votre compte bancaire.", ephemeral=True
+            return await send(
+                interaction, f"Vous n'avez pas assez d'argent sur votre compte bancaire.", ephemeral=True
             )
 
         participant = [self.author, self.target]
@@ -50,10 +55,18 @@ class CoinFlipConfirmationView(ui.View):
         loser = participant[0]
 
         await interaction.client.mongo.update_user_data_document(
-            winner.id, {"$inc": {"bank": self.amount, "coinflip_won": 1}}
+            winner.id, {"$inc": {"bank": self.amount, "coinflip_won": 1}}, interaction.guild_id
         )
         await interaction.client.mongo.update_user_data_document(
-            loser.id, {"$inc": {"bank": -self.amount, "coinflip_won": 1}}
+            loser.id, {"$inc": {"bank": -self.amount, "coinflip_won": 1}}, interaction.guild_id
+        )
+        interaction.client.events.log(
+            "game", winner.id, self.amount, game="coinflip", won=True, target_id=loser.id,
+            guild_id=interaction.guild_id
+        )
+        interaction.client.events.log(
+            "game", loser.id, -self.amount, game="coinflip", won=False, target_id=winner.id,
+            guild_id=interaction.guild_id
         )
 
         coinflip_embed = discord.Embed(
@@ -65,42 +78,7 @@ class CoinFlipConfirmationView(ui.View):
         )
         coinflip_embed.set_footer(text=interaction.client.user.name, icon_url=interaction.client.user.display_avatar)
 
-        await interaction.response.edit_message(content=None, view=None, embed=coinflip_embed)
-
-
-class RouletteReplay(ui.View):
-
-    def __init__(self, author_id: int, cog: commands.Cog, color: Choice[str], amount: int):
-        super().__init__(timeout=60.0)
-        self.author_id = author_id
-        self.cog = cog
-        self.color = color
-        self.amount = amount
-
-    @discord.ui.button(label="Rejouer", emoji="🔁", style=discord.ButtonStyle.blurple)
-    async def replay(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
-        if interaction.user.id != self.author_id:
-            return await interaction.response.send_message("Ce boutton ne vous cible pas.", ephemeral=True)
-
-        roulette_command = interaction.client.tree.get_command("roulette")
-        await roulette_command.callback(self.cog, interaction, self.color, self.amount)
-
-
-class SlotsReplay(ui.View):
-
-    def __init__(self, author_id: int, cog: commands.Cog, amount: int):
-        super().__init__(timeout=60.0)
-        self.author_id = author_id
-        self.cog = cog
-        self.amount = amount
-
-    @discord.ui.button(label="Rejouer", emoji="🔁", style=discord.ButtonStyle.blurple)
-    async def replay(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
-        if interaction.user.id != self.author_id:
-            return await interaction.response.send_message("Ce boutton ne vous cible pas.", ephemeral=True)
-
-        slots_command = interaction.client.tree.get_command("slots")
-        await slots_command.callback(self.cog, interaction, self.amount)
+        await edit(interaction, content=None, view=None, embed=coinflip_embed)
 
 
 class Games(commands.Cog):
@@ -124,14 +102,39 @@ class Games(commands.Cog):
     SLOTS_EMOJIS = {"🍒": 3, "🍌": 3, "🍎": 2, "🍓": 1.5}
     SLOTS_WEIGHTS = [0.1, 0.1, 0.4, 0.5]
 
+    ROUTES = ("roulette_replay", "slots_replay", "blackjack_hit", "blackjack_stay", "blackjack_replay")
+
     def __init__(self, client: CryptoMC):
         self.client = client
 
+    async def cog_load(self) -> None:
+        self.client.components.register("roulette_replay", self._replay_roulette)
+        self.client.components.register("slots_replay", self._replay_slots)
+        self.client.components.register("blackjack_hit", blackjack.hit)
+        self.client.components.register("blackjack_stay", blackjack.stay)
+        self.client.components.register("blackjack_replay", blackjack.replay)
+
+    async def cog_unload(self) -> None:
+        for route in self.ROUTES:
+            self.client.components.unregister(route)
+
+    async def _replay_roulette(self, interaction: discord.Interaction, author_id: str, amount: str, color: str) -> None:
+        if interaction.user.id != int(author_id):
+            return await send(interaction, "Ce boutton ne vous cible pas.", ephemeral=True)
+
+        await self.roulette.callback(self, interaction, Choice(name=color, value=color), int(amount))
+
+    async def _replay_slots(self, interaction: discord.Interaction, author_id: str, amount: str) -> None:
+        if interaction.user.id != int(author_id):
+            return await send(interaction, "Ce boutton ne vous cible pas.", ephemeral=True)
+
+        await self.slots.callback(self, interaction, int(amount))
+
     async def _is_bet_amount_valid(self, interaction: discord.Interaction, amount: int) -> None:
         if amount < 1:
             raise errors.InvalidAmount
 
-        user_data = await self.client.mongo.fetch_user_data(interaction.user.id)
+        user_data = await self.client.mongo.fetch_user_data(interaction.user.id, interaction.guild_id)
         if user_data["bank"] < amount:
             raise errors.NotEnoughFunds
 
@@ -144,7 +147,10 @@ class Games(commands.Cog):
         if any([d for d in interaction.user.roles if d.is_premium_subscriber() is True]):
             mined = int(mined * 1.15)
 
-        await self.client.mongo.update_user_data_document(interaction.user.id, {"$inc": {"bank": mined}})
+        await self.client.mongo.update_user_data_document(
+            interaction.user.id, {"$inc": {"bank": mined}}, interaction.guild_id
+        )
+        self.client.events.log("income", interaction.user.id, mined, game="mine", guild_id=interaction.guild_id)
 
         await self.client.embed(
             interaction, "**⛏ Minage**", f"Vous venez de miner **{mined}** {self.client.config['coin']}."
@@ -160,7 +166,10 @@ class Games(commands.Cog):
         if any([d for d in interaction.user.roles if d.is_premium_subscriber() is True]):
             earned = int(earned * 1.15)
 
-        await self.client.mongo.update_user_data_document(interaction.user.id, {"$inc": {"bank": earned}})
+        await self.client.mongo.update_user_data_document(
+            interaction.user.id, {"$inc": {"bank": earned}}, interaction.guild_id
+        )
+        self.client.events.log("income", interaction.user.id, earned, game="work", guild_id=interaction.guild_id)
 
         await self.client.embed(
             interaction, "**💵 Travail**",
@@ -176,7 +185,7 @@ class Games(commands.Cog):
             Choice(name="Rouge", value="red"), Choice(name="Noir", value="black"), Choice(name="Vert", value="green")
         ]
     )
-    @app_commands.checks.cooldown(1, 3, key=lambda i: i.user.id)
+    @cooldown(CooldownType.USER, 3)
     async def roulette(self, interaction: discord.Interaction, color: Choice[str], amount: int):
         """Jouer à la roulette afin de tenter de gagner des Lulux Coins."""
         await self._is_bet_amount_valid(interaction, amount)
@@ -192,26 +201,30 @@ class Games(commands.Cog):
             msg = f"Vous venez de perdre votre partie de roulette, vous perdez **{amount}** " \
                   f"{self.client.config['coin']}."
 
-        await self.client.mongo.update_user_data_document(interaction.user.id, update_actions)
+        await self.client.mongo.update_user_data_document(interaction.user.id, update_actions, interaction.guild_id)
+        self.client.events.log(
+            "game", interaction.user.id, update_actions["$inc"]["bank"], game="roulette",
+            won=winning_color == color.value, guild_id=interaction.guild_id
+        )
 
         await self.client.embed(
             interaction,
             title="**💈 Roulette**",
             description=f"Résultat: {self.ROULETTE_EMOJIS[winning_color]}\n\n"
                         f"{msg}",
-            view=RouletteReplay(interaction.user.id, self, color, amount)
+            view=static_view(replay_button("roulette_replay", interaction.user.id, amount, color.value))
         )
 
     @app_commands.command(name="slots")
     @app_commands.rename(amount="montant")
     @app_commands.describe(amount="Montant que vous misez")
-    @app_commands.checks.cooldown(1, 3, key=lambda i: i.user.id)
+    @cooldown(CooldownType.USER, 3)
     async def slots(self, interaction: discord.Interaction, amount: int):
         """Jouer à la machine à sous afin de tenter de gagner des Lulux Coins."""
         await self._is_bet_amount_valid(interaction, amount)
 
         slots_result = random.choices(list(self.SLOTS_EMOJIS), weights=self.SLOTS_WEIGHTS, k=9)
-        slots_rows = np.array_split(slots_result, 3)
+        slots_rows = [slots_result[i:i + 3] for i in range(0, 9, 3)]
 
         if all(x == slots_rows[1][0] for x in slots_rows[1]):
             amount_won = int(amount * self.SLOTS_EMOJIS[slots_rows[1][0]])
@@ -223,7 +236,11 @@ class Games(commands.Cog):
             msg = f"Vous venez de perdre votre partie de machine à sous, vous perdez **{amount}** " \
                   f"{self.client.config['coin']}."
 
-        await self.client.mongo.update_user_data_document(interaction.user.id, update_actions)
+        await self.client.mongo.update_user_data_document(interaction.user.id, update_actions, interaction.guild_id)
+        self.client.events.log(
+            "game", interaction.user.id, update_actions["$inc"]["bank"], game="slots",
+            won="slots_won" in update_actions["$inc"], guild_id=interaction.guild_id
+        )
 
         await self.client.embed(
             interaction,
@@ -232,32 +249,33 @@ class Games(commands.Cog):
                         f"➡ {''.join(d for d in slots_rows[1])} ⬅\n"
                         f"🎰 {''.join(d for d in slots_rows[2])} 🎰\n\n"
                         f"{msg}",
-            view=SlotsReplay(interaction.user.id, self, amount)
+            view=static_view(replay_button("slots_replay", interaction.user.id, amount))
         )
 
     @app_commands.command(name="coinflip")
     @app_commands.rename(target="utilisateur", amount="montant")
     @app_commands.describe(target="Utilisateur contre qui vous voulez jouer", amount="Montant du coinflip")
-    @app_commands.checks.cooldown(1, 3, key=lambda i: i.user.id)
+    @cooldown(CooldownType.USER, 3)
     async def coinflip(self, interaction: discord.Interaction, target: discord.User, amount: int):
         """Jouer une partie de coinflip contre un utilisateur."""
         await self._is_bet_amount_valid(interaction, amount)
 
         if target.id == interaction.user.id:
-            return await interaction.response.send_message("Vous ne pouvez pas jouer contre vous-même.", ephemeral=True)
+            return await send(interaction, "Vous ne pouvez pas jouer contre vous-même.", ephemeral=True)
 
         if target.id == self.client.user.id:
-            return await interaction.response.send_message("Vous ne pouvez pas jouer contre le bot.", ephemeral=True)
+            return await send(interaction, "Vous ne pouvez pas jouer contre le bot.", ephemeral=True)
 
-        target_data = await self.client.mongo.fetch_user_data(target.id)
+        target_data = await self.client.mongo.fetch_user_data(target.id, interaction.guild_id)
         if target_data["bank"] < amount:
-            return await interaction.response.send_message(
-                f"{target.mention} n'a pas assez d'argent sur son compte bancaire.", ephemeral=True
+            return await send(
+                interaction, f"{target.mention} n'a pas assez d'argent sur son compte bancaire.", ephemeral=True
             )
 
-        await interaction.response.send_message(
-            f"{target.mention}, vous venez de recevoir une demande de pile ou face de {interaction.user.mention} pour "
-            f"**{amount}** {self.client.config['coin']}.\n"
+        await send(
+            interaction,
+            f"{target.mention}, vous venez de recevoir une demande de pile ou face de {interaction.user.mention} "
+            f"pour **{amount}** {self.client.config['coin']}.\n"
             f"Vous pouvez accepter la demande en réagissant à ce message avec ✅ et la refuser avec ❌.",
             view=CoinFlipConfirmationView(interaction.user, target, amount)
         )
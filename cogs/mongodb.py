@@ -1,10 +1,12 @@
-from typing import Dict, Any
+import asyncio
+import copy
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
-import motor.motor_asyncio
 import ujson
 from discord.ext import commands
 
 from cryptomc import CryptoMC
+from utils.tracing import span
 
 
 class MongoDB(commands.Cog):
@@ -25,7 +27,19 @@ class MongoDB(commands.Cog):
 
     def __init__(self, client: CryptoMC):
         self.client = client
-        self.db = motor.motor_asyncio.AsyncIOMotorClient(self.client.config["mongodb_uri"])["cryptomc"]
+        # The client belongs to the bot, so its pool survives the reloads of this cog.
+        self.db = self.client.motor["cryptomc"]
+
+        # The reads being run, keyed by operation and arguments.
+        self.in_flight: Dict[Tuple[Any, ...], asyncio.Task] = {}
+
+    async def cog_load(self) -> None:
+        if self.client.guild_scoped:
+            # Partial, the documents of the single-guild layout have neither field.
+            await self.db["user"].create_index(
+                [("guild_id", 1), ("user_id", 1)], unique=True, partialFilterExpression={"guild_id": {"$exists": True}}
+            )
+            await self.db["user"].create_index([("guild_id", 1), ("bank", -1)])
 
     @staticmethod
     def _set_default_dict(current_dict, default_dict) -> Dict[str, Any]:
@@ -40,10 +54,45 @@ class MongoDB(commands.Cog):
 
         return current_dict
 
+    """ Single-flight. """
+
+    def _forget(self, key: Tuple[Any, ...], task: asyncio.Task) -> None:
+        if self.in_flight.get(key) is task:
+            del self.in_flight[key]
+
+        # Retrieves the exception, in case every caller was cancelled meanwhile.
+        if not task.cancelled():
+            task.exception()
+
+    async def _single_flight(self, key: Tuple[Any, ...], read: Callable[[], Awaitable[Any]]) -> Any:
+        """Runs the read, or waits for the identical one already running, and returns a copy of its result."""
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(read())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.client.metrics.inc("cryptomc_mongo_coalesced_total", op=key[0])
+
+        # Shielded, so a caller cancelled does not cancel the read of the others.
+        return copy.deepcopy(await asyncio.shield(task))
+
     """ User collection. """
 
-    async def fetch_user_data(self, user_id: int) -> Dict[str, int]:
-        user = await self.db["user"].find_one({"_id": str(user_id)})
+    def _user_filter(self, user_id: int, guild_id: Optional[int]) -> Dict[str, str]:
+        """Returns the filter of the user's document, which is per guild when the economy is guild-scoped."""
+        if not self.client.guild_scoped:
+            return {"_id": str(user_id)}
+
+        # The equality fields are copied into the documents created by an upsert.
+        return {"_id": f"{guild_id}:{user_id}", "guild_id": str(guild_id), "user_id": str(user_id)}
+
+    def _scope(self, guild_id: Optional[int]) -> Optional[int]:
+        return guild_id if self.client.guild_scoped else None
+
+    async def _read_user_data(self, user_id: int, guild_id: Optional[int]) -> Dict[str, int]:
+        with span("mongo_read"), self.client.metrics.timer("cryptomc_backend", backend="mongo", op="fetch_user_data"):
+            user = await self.db["user"].find_one(self._user_filter(user_id, guild_id))
         if user is not None:
             user = self._set_default_dict(user, self.DEFAULT_USER_DATA)
         else:
@@ -53,8 +102,45 @@ class MongoDB(commands.Cog):
 
         return user
 
-    async def update_user_data_document(self, user_id: int, query: Dict[str, Any]) -> None:
-        await self.db["user"].update_one({"_id": str(user_id)}, query, upsert=True)
+    async def fetch_user_data(self, user_id: int, guild_id: Optional[int] = None) -> Dict[str, int]:
+        guild_id = self._scope(guild_id)
+        return await self._single_flight(
+            ("fetch_user_data", guild_id, int(user_id)), lambda: self._read_user_data(user_id, guild_id)
+        )
+
+    async def _read_leaderboard(self, limit: Optional[int], guild_id: Optional[int]) -> List[Dict[str, Any]]:
+        if not self.client.guild_scoped:
+            pipeline = [{"$match": {"bank": {"$exists": True}}}, {"$project": {"bank": 1}}, {"$sort": {"bank": -1}}]
+        else:
+            # Served by the (guild_id, bank) index, the documents are returned keyed by user id as in global scope.
+            match = {"bank": {"$exists": True}}
+            if guild_id is not None:
+                match["guild_id"] = str(guild_id)
+            pipeline = [{"$match": match}, {"$sort": {"bank": -1}}, {"$project": {"_id": "$user_id", "bank": 1}}]
+
+        if limit is not None:
+            pipeline.append({"$limit": limit})
+
+        with span("mongo_read"), self.client.metrics.timer("cryptomc_backend", backend="mongo", op="fetch_leaderboard"):
+            return await self.db["user"].aggregate(pipeline).to_list(None)
+
+    async def fetch_leaderboard(self, limit: Optional[int] = None,
+                                guild_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Returns the users sorted by bank, the richest first. Without guild, the users of every guild are ranked."""
+        guild_id = self._scope(guild_id)
+        return await self._single_flight(
+            ("fetch_leaderboard", guild_id, limit), lambda: self._read_leaderboard(limit, guild_id)
+        )
+
+    async def update_user_data_document(self, user_id: int, query: Dict[str, Any],
+                                        guild_id: Optional[int] = None) -> None:
+        guild_id = self._scope(guild_id)
+        # The reads started before the write may miss it, the next ones must not join them.
+        self.in_flight.pop(("fetch_user_data", guild_id, int(user_id)), None)
+
+        with span("mongo_write"), \
+                self.client.metrics.timer("cryptomc_backend", backend="mongo", op="update_user_data_document"):
+            await self.db["user"].update_one(self._user_filter(user_id, guild_id), query, upsert=True)
 
 
 async def setup(client):
@@ -8,6 +8,7 @@ from discord.ext import commands, menus
 from cryptomc import CryptoMC
 from utils.checks import CooldownType, cooldown
 from utils.menus import InteractionViewMenu
+from utils.responder import send
 
 
 class LeaderboardMenuSource(menus.ListPageSource):
@@ -56,7 +57,7 @@ class Profile(commands.Cog):
         if user is None:
             user = interaction.user
 
-        user_data = await self.client.mongo.fetch_user_data(user.id)
+        user_data = await self.client.mongo.fetch_user_data(user.id, interaction.guild_id)
         profile_embed = discord.Embed(
             title=f"**{user}**",
             description=f"🏦 **Banque**: {user_data['bank']:,} {self.client.config['coin']}\n"
@@ -74,15 +75,15 @@ class Profile(commands.Cog):
         profile_embed.set_thumbnail(url=user.display_avatar)
         profile_embed.set_footer(text=f"{user}", icon_url=user.display_avatar)
 
-        await interaction.response.send_message(embed=profile_embed)
+        await send(interaction, embed=profile_embed)
 
     @app_commands.command(name="leaderboard")
     async def leaderboard(self, interaction: discord.Interaction):
         """Afficher le classement des utilisateurs avec le plus de Lulux Coins."""
-        pipeline = [{"$match": {"bank": {"$exists": True}}}, {"$project": {"bank": 1}}, {"$sort": {"bank": -1}}]
-        cursor = self.client.mongo.db["user"].aggregate(pipeline)
+        leaderboard_list = await self.client.mongo.fetch_leaderboard(guild_id=interaction.guild_id)
+
         menu = InteractionViewMenu(
-            source=LeaderboardMenuSource(await cursor.to_list(None)), clear_reactions_after=True, timeout=30.0
+            source=LeaderboardMenuSource(leaderboard_list), clear_reactions_after=True, timeout=30.0
         )
         await menu.start(interaction, wait=True)
 
@@ -92,21 +93,29 @@ class Profile(commands.Cog):
     async def pay(self, interaction: discord.Interaction, target: discord.User, amount: int):
         """Payer un utilisateur."""
         if interaction.user.id == target.id:
-            return await interaction.response.send_message("Vous ne pouvez pas vous payer vous-même.", ephemeral=True)
+            return await send(interaction, "Vous ne pouvez pas vous payer vous-même.", ephemeral=True)
 
         if amount < 1:
-            return await interaction.response.send_message(
-                "Vous ne pouvez pas payer un montant inférieur à 1.", ephemeral=True
+            return await send(
+                interaction, "Vous ne pouvez pas payer un montant inférieur à 1.", ephemeral=True
             )
 
-        user_data = await self.client.mongo.fetch_user_data(interaction.user.id)
+        user_data = await self.client.mongo.fetch_user_data(interaction.user.id, interaction.guild_id)
         if user_data["bank"] < amount:
-            return await interaction.response.send_message(
-                "Vous n'avez pas assez d'argent sur votre compte bancaire.", ephemeral=True
+            return await send(
+                interaction, "Vous n'avez pas assez d'argent sur votre compte bancaire.", ephemeral=True
             )
 
-        await self.client.mongo.update_user_data_document(interaction.user.id, {"$inc": {"bank": -amount}})
-        await self.client.mongo.update_user_data_document(target.id, {"$inc": {"bank": amount}})
+        await self.client.mongo.update_user_data_document(
+            interaction.user.id, {"$inc": {"bank": -amount}}, interaction.guild_id
+        )
+        await self.client.mongo.update_user_data_document(target.id, {"$inc": {"bank": amount}}, interaction.guild_id)
+        self.client.events.log(
+            "transfer", interaction.user.id, -amount, target_id=target.id, guild_id=interaction.guild_id
+        )
+        self.client.events.log(
+            "transfer", target.id, amount, target_id=interaction.user.id, guild_id=interaction.guild_id
+        )
 
         await self.client.embed(
             interaction, "**💵 Paiement**",
@@ -121,7 +130,10 @@ class Profile(commands.Cog):
         if any([d for d in interaction.user.roles if d.is_premium_subscriber() is True]):
             earned = int(earned * 1.15)
 
-        await self.client.mongo.update_user_data_document(interaction.user.id, {"$inc": {"bank": earned}})
+        await self.client.mongo.update_user_data_document(
+            interaction.user.id, {"$inc": {"bank": earned}}, interaction.guild_id
+        )
+        self.client.events.log("income", interaction.user.id, earned, game="hourly", guild_id=interaction.guild_id)
 
         await self.client.embed(
             interaction, "**⏱ Récolte horaire**",
@@ -136,7 +148,10 @@ class Profile(commands.Cog):
         if any([d for d in interaction.user.roles if d.is_premium_subscriber() is True]):
             earned = int(earned * 1.15)
 
-        await self.client.mongo.update_user_data_document(interaction.user.id, {"$inc": {"bank": earned}})
+        await self.client.mongo.update_user_data_document(
+            interaction.user.id, {"$inc": {"bank": earned}}, interaction.guild_id
+        )
+        self.client.events.log("income", interaction.user.id, earned, game="daily", guild_id=interaction.guild_id)
 
         await self.client.embed(
             interaction, "**⏰ Récolte quotidienne**",
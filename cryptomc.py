@@ -1,49 +1,105 @@
 from __future__ import annotations
 
+from utils.startup import startup_report
+
 import importlib
-import json
 import os
 import random as random
-from typing import Optional, TYPE_CHECKING
-
-from redis import asyncio as aioredis
-import discord
-from discord.ext import commands
-
-import utils.blackjack as blackjack
-import utils.checks as checks
-import utils.errors as errors
-import utils.menus as menus
+import sys
+import time
+from typing import Dict, List, Optional, TYPE_CHECKING
+
+with startup_report.timed_imports():
+    import discord
+    from discord import app_commands
+    from discord.ext import commands
+
+    import utils.blackjack as blackjack
+    import utils.cluster as cluster
+    import utils.components as components
+    import utils.database as database
+    import utils.eventlog as eventlog
+    import utils.metrics as metrics
+    import utils.pipelining as pipelining
+    import utils.profiler as profiler
+    import utils.reloader as reloader
+    import utils.reporting as reporting
+    import utils.responder as responder
+    import utils.tracing as tracing
+    from utils.config import load_config
 
 if TYPE_CHECKING:
     from cogs.mongodb import MongoDB
 
 os.environ["JISHAKU_HIDE"] = "true"
 
-with open("config.json", "r") as fic:
-    config = dict(json.load(fic))
+
+class CommandTree(app_commands.CommandTree):
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        interaction.extras["started_at"] = time.perf_counter()
+        responder.arm(interaction)
+        if interaction.command is not None:
+            self.client.recorder.start(interaction, interaction.command.qualified_name)
+        return True
 
 
-class CryptoMC(commands.Bot):
-    """The Bot for the CryptoMC Discord bot."""
+class CryptoMC(commands.AutoShardedBot):
+    """The Bot for the CryptoMC Discord bot.
 
-    def __init__(self):
+    Run alone, it connects to every shard. In cluster mode, see `utils.cluster`, it connects to `shard_ids` only.
+    """
+
+    def __init__(self, cluster_id: int = 0, shard_ids: Optional[List[int]] = None, shard_count: Optional[int] = None):
         super().__init__(
             command_prefix=";;",
             intents=discord.Intents.all(),
             chunk_guilds_at_startup=True,
             case_insensitive=True,
-            owner_id=212844004889329664
+            owner_id=212844004889329664,
+            tree_cls=CommandTree,
+            shard_ids=shard_ids,
+            shard_count=shard_count
         )
 
         random._inst = random.SystemRandom()
 
         self.remove_command("help")
 
-        self.config = config
+        self.config = load_config()
         self.color = 0xf7ac1c
 
+        # Whether each guild has its own economy, rather than one shared by every guild.
+        self.guild_scoped = self.config.get("economy_scope", "global") == "guild"
+
+        self.cluster_id = cluster_id
+        self.leadership: Optional[cluster.Leadership] = None
+        self.leadership_task = None
+
         self.redis = None
+        self.motor = None
+        self.events: Optional[eventlog.EventLog] = None
+
+        self.metrics = metrics.Metrics()
+        self.metrics_runner = None
+
+        tracing_config = self.config.get("tracing", {})
+        self.recorder = tracing.FlightRecorder(tracing_config.get("enabled", False), tracing_config.get("keep", 50))
+
+        errors_config = self.config.get("errors", {})
+        self.reporter = reporting.ErrorReporter(
+            self.metrics,
+            errors_config.get("path", "errors-{cluster}.log").format(cluster=cluster_id),
+            errors_config.get("max_bytes", 5_000_000),
+            errors_config.get("backup_count", 3)
+        )
+
+        self.profiler = None
+
+        self.module_hashes: Dict[str, str] = {}
+
+        self.components = components.ComponentDispatcher()
+        self.renderer = blackjack.RenderScheduler(self.metrics, **self.config.get("render", {}))
 
     @property
     def mongo(self) -> Optional[MongoDB]:
@@ -52,7 +108,8 @@ class CryptoMC(commands.Bot):
     """ Response utils. """
 
     async def embed(self, interaction: discord.Interaction, title: str, description: str, **kwargs) -> None:
-        await interaction.response.send_message(
+        await responder.send(
+            interaction,
             embed=discord.Embed(
                 title=title,
                 description=description,
@@ -62,46 +119,128 @@ class CryptoMC(commands.Bot):
             **kwargs
         )
 
+    """ Events. """
+
+    async def on_interaction(self, interaction: discord.Interaction) -> None:
+        await self.components.dispatch(interaction)
+
     """ Ready actions. """
 
     async def ready_actions(self) -> None:
         await self.wait_until_ready()
 
-        print(f"Ready: {self.user} (ID: {self.user.id}).")
+        startup_report.ready()
+        print(f"Ready: {self.user} (ID: {self.user.id}).\n{startup_report.format()}")
+
+        # The owner tools are not needed to serve the users, so they are loaded once the bot is ready.
+        with startup_report.timed("extension", "jishaku"):
+            await self.load_extension("jishaku")
+        self.profiler = profiler.SamplingProfiler(self.loop, **self.config.get("profiler", {}))
 
     """ Setup actions. """
 
     async def setup_hook(self) -> None:
+        with startup_report.timed("phase", "setup_hook"):
+            await self._setup()
+
+    async def _setup(self) -> None:
         self.loop.create_task(self.ready_actions())
+        self.reporter.start()
+
+        # The commands sent by the concurrent interactions are batched, one round trip per loop iteration.
+        self.redis = pipelining.AutoPipeline.create(
+            self.metrics, self.config["redis_con"], encoding="utf-8", decode_responses=True
+        )
+        self.motor = database.create_client(self.config, self.metrics)
+        self.events = eventlog.EventLog(self.motor["cryptomc"], self.redis, self.metrics, self.cluster_id)
 
-        self.redis = await aioredis.from_url(self.config["redis_con"], encoding="utf-8", decode_responses=True)
+        self.leadership = cluster.Leadership(
+            self.redis, self.metrics, self.cluster_id, self.config.get("cluster", {}).get("leader_ttl", 30)
+        )
+        self.leadership_task = self.loop.create_task(self.leadership.run())
 
         for filename in os.listdir("./cogs"):
             if filename.endswith(".py"):
-                await self.load_extension(f"cogs.{filename[:-3]}")
+                with startup_report.timed("extension", f"cogs.{filename[:-3]}"):
+                    await self.load_extension(f"cogs.{filename[:-3]}")
 
-        await self.load_extension("jishaku")
+        self.module_hashes = reloader.module_hashes()
 
-        await self.sync_guild()
+        # The commands belong to the application rather than to a shard, a single process of the cluster syncs them.
+        if self.cluster_id == 0:
+            with startup_report.timed("phase", "sync_guild"):
+                await self.sync_guild()
 
-    """ Helper functions. """
+        if "metrics_port" in self.config:
+            # Each process of a cluster serves its own metrics, on the port following the previous one's.
+            port = self.config["metrics_port"] + self.cluster_id
+            self.metrics_runner = await metrics.start_server(
+                self.metrics, self.config.get("metrics_host", "127.0.0.1"), port
+            )
 
-    async def sync_guild(self) -> None:
-        guild = discord.Object(id=self.config["guild_id"])
-        self.tree.copy_global_to(guild=guild)
-        await self.tree.sync(guild=guild)
+    async def close(self) -> None:
+        # Unloads the extensions first, their last writes need the clients closed below.
+        await super().close()
 
-    async def reload_modules(self) -> None:
-        importlib.reload(blackjack)
-        importlib.reload(checks)
-        importlib.reload(errors)
-        importlib.reload(menus)
+        if self.leadership_task is not None:
+            self.leadership_task.cancel()
+            await self.leadership.release()
 
-        for filename in os.listdir("./cogs"):
-            if filename.endswith(".py"):
-                await self.reload_extension(f"cogs.{filename[:-3]}")
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+
+        self.renderer.close()
+        self.reporter.stop()
+
+        if self.motor is not None:
+            self.motor.close()
+
+    """ Helper functions. """
+
+    async def sync_guild(self) -> None:
+        for guild_id in self.config.get("guild_ids", [self.config["guild_id"]]):
+            guild = discord.Object(id=guild_id)
+            self.tree.copy_global_to(guild=guild)
+            await self.tree.sync(guild=guild)
+
+    async def reload_modules(self) -> Dict[str, float]:
+        """Reloads the modules changed since they were loaded and the ones importing them, returns their reload time.
+        """
+        hashes = reloader.module_hashes()
+        changed = {module for module, digest in hashes.items() if self.module_hashes.get(module) != digest}
+        dependencies = reloader.module_dependencies(hashes)
+
+        timings = {}
+        for module in reloader.reload_order(changed, dependencies):
+            start = time.perf_counter()
+            if module.startswith("cogs."):
+                if module in self.extensions:
+                    await self.reload_extension(module)
+                else:
+                    await self.load_extension(module)
+            elif module in sys.modules:
+                importlib.reload(sys.modules[module])
+            else:
+                # Not imported yet, its first import will read the new version.
+                self.module_hashes[module] = hashes[module]
+                continue
+
+            timings[module] = time.perf_counter() - start
+            self.module_hashes[module] = hashes[module]
+
+        for module in set(self.module_hashes) - set(hashes):
+            start = time.perf_counter()
+            if module in self.extensions:
+                await self.unload_extension(module)
+                timings[module] = time.perf_counter() - start
+            del self.module_hashes[module]
+
+        return timings
 
 
 if __name__ == "__main__":
+    # The cogs import this module as `cryptomc`, which must not run it a second time.
+    sys.modules.setdefault("cryptomc", sys.modules[__name__])
+
     bot = CryptoMC()
-    bot.run(config["bot_token"])
+    bot.run(bot.config["bot_token"])
@@ -1,13 +1,26 @@
+from __future__ import annotations
+
+import asyncio
 import functools
 import os
 import random
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from io import BytesIO
 from pathlib import Path
-from typing import List, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
 
 import discord
-from PIL import Image
+import ujson
+
+from utils.components import button, replay_button, static_view
+from utils.metrics import Metrics
+from utils.responder import edit, send
+from utils.startup import startup_report
+from utils.tracing import span
+
+if TYPE_CHECKING:
+    from PIL import Image
 
 ABS_PATH = Path(os.getcwd())
 
@@ -93,64 +106,157 @@ class Player:
         self.calculate_hand()
 
 
-class PlayBlackjackView(discord.ui.View):
-
-    def __init__(self, game):
-        super().__init__()
-        self.game = game
-        self.done = False
+class RenderScheduler:
+    """Runs the table renders on a bounded pool, and sheds them when it is saturated.
 
-    @discord.ui.button(label="Tirer", emoji="➕", style=discord.ButtonStyle.gray)
-    async def hit(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
-        if interaction.user.id != self.game.interaction.user.id or self.done:
-            return await interaction.response.send_message("Ce boutton ne vous cible pas.", ephemeral=True)
+    At most `concurrency` renders run at once and at most `max_queue` wait for a slot. A render is shed when the queue
+    is full or when no slot frees up within `deadline` seconds, the game then answers without its table.
+    """
 
-        self.done = True
+    def __init__(self, metrics: Metrics, concurrency: int = 2, max_queue: int = 16, deadline: float = 5.0):
+        self.metrics = metrics
+        self.max_queue = max_queue
+        self.deadline = deadline
 
-        await self.game.process_turn(interaction, Action.HIT)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="render")
+        self.semaphore = asyncio.Semaphore(concurrency)
 
-    @discord.ui.button(label="Rester", emoji="❌", style=discord.ButtonStyle.gray)
-    async def stay(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
-        if interaction.user.id != self.game.interaction.user.id or self.done:
-            return await interaction.response.send_message("Ce boutton ne vous cible pas.", ephemeral=True)
+        self.queued = 0
+        self.running = 0
 
-        self.done = True
-        
-        await self.game.process_turn(interaction, Action.STAY)
+    def _update_gauges(self) -> None:
+        self.metrics.set("cryptomc_render_queue_depth", self.queued)
+        self.metrics.set("cryptomc_render_running", self.running)
 
+    def _shed(self, reason: str) -> None:
+        self.metrics.inc("cryptomc_render_shed_total", reason=reason)
 
-class BlackjackReplay(discord.ui.View):
+    async def render(self, func: Callable[[], BytesIO]) -> Optional[BytesIO]:
+        if self.queued >= self.max_queue:
+            self._shed("queue_full")
+            return None
 
-    def __init__(self, author_id: int, amount: int):
-        super().__init__(timeout=60.0)
-        self.author_id = author_id
-        self.amount = amount
+        self.queued += 1
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.deadline)
+        except asyncio.TimeoutError:
+            self._shed("deadline")
+            return None
+        finally:
+            self.queued -= 1
+            self._update_gauges()
 
-    @discord.ui.button(label="Rejouer", emoji="🔁", style=discord.ButtonStyle.blurple)
-    async def replay(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
-        if interaction.user.id != self.author_id:
-            return await interaction.response.send_message("Ce boutton ne vous cible pas.", ephemeral=True)
+        try:
+            self.running += 1
+            self._update_gauges()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self.executor, func)
+            finally:
+                self.running -= 1
+        finally:
+            self.semaphore.release()
+            self._update_gauges()
 
-        slots_command = interaction.client.tree.get_command("blackjack")
-        cog = interaction.client.get_cog("Games")
-        await slots_command.callback(cog, interaction, self.amount)
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
 
 class BlackjackGame:
+    """A game of blackjack, saved in Redis between the turns so any process of the cluster can play the next one."""
+
+    # Seconds without action after which a game is abandoned.
+    TIMEOUT = 180
+
+    KEY = "cryptomc_blackjack:{}"
 
     def __init__(self, interaction: discord.Interaction, bet_amount: int):
         self.interaction = interaction
         self.bet_amount = bet_amount
 
+        self.id = interaction.id
+        self.user_id = interaction.user.id
+        self.turn = 0
+        # Whether the message of the game was sent, the next turns edit it.
+        self.started = False
+
+        # The cards shown by the last uploaded table.
+        self.frame: Tuple[Tuple[str, ...], ...] = ()
+
         self.players: List[Player] = []
         self.deck: List[Card] = []
 
+    """ Shared state. """
+
+    @staticmethod
+    def _dump_cards(cards: List[Card]) -> List[Tuple[str, int, bool]]:
+        return [(card.suit, card.value, card.down) for card in cards]
+
+    @staticmethod
+    def _load_cards(cards: List[Tuple[str, int, bool]]) -> List[Card]:
+        loaded = []
+        for suit, value, down in cards:
+            card = Card(suit, value)
+            card.down = down
+            loaded.append(card)
+        return loaded
+
+    def _dump(self) -> Dict[str, Any]:
+        return {
+            "user_id": self.user_id,
+            "bet_amount": self.bet_amount,
+            "turn": self.turn,
+            "frame": self.frame,
+            "players": [
+                {"dealer": player.dealer, "standing": player.standing, "hand": self._dump_cards(player.hand)}
+                for player in self.players
+            ],
+            "deck": self._dump_cards(self.deck)
+        }
+
+    @classmethod
+    def load(cls, interaction: discord.Interaction, game_id: int, data: Dict[str, Any]) -> BlackjackGame:
+        """Restores a game saved by `_save` for the interaction playing its next turn."""
+        game = cls(interaction, data["bet_amount"])
+        game.id = game_id
+        game.user_id = data["user_id"]
+        game.turn = data["turn"]
+        game.started = True
+        game.frame = tuple(tuple(hand) for hand in data["frame"])
+
+        for player_data in data["players"]:
+            player = Player(dealer=player_data["dealer"])
+            player.standing = player_data["standing"]
+            player.hand = cls._load_cards(player_data["hand"])
+            player.calculate_hand()
+            game.players.append(player)
+
+        game.deck = cls._load_cards(data["deck"])
+        return game
+
+    async def _save(self) -> None:
+        with self.interaction.client.metrics.timer("cryptomc_backend", backend="redis", op="blackjack_save"):
+            await self.interaction.client.redis.set(
+                self.KEY.format(self.id), ujson.dumps(self._dump()), ex=self.TIMEOUT
+            )
+
+    async def _discard(self) -> None:
+        with self.interaction.client.metrics.timer("cryptomc_backend", backend="redis", op="blackjack_discard"):
+            await self.interaction.client.redis.delete(self.KEY.format(self.id))
+
+    """ Rendering. """
+
     @staticmethod
     def _hand_to_images(hand: List[Card]) -> List[Image.Image]:
+        # Pillow is imported by the first render rather than at startup.
+        Image = startup_report.import_module("PIL.Image")
+
         return [Image.open(os.path.join(ABS_PATH, "assets/cards/", card.image)) for card in hand]
 
     @staticmethod
     def _center(hands: List[List[Image.Image]]) -> Image.Image:
+        Image = startup_report.import_module("PIL.Image")
+
         bg = Image.open(os.path.join(ABS_PATH, "assets/", "table.png"))
         bg_center_x = bg.size[0] // 2
         bg_center_y = bg.size[1] // 2
@@ -168,18 +274,30 @@ class BlackjackGame:
             start_y += img_h + 15
         return bg
 
-    def _get_output(self) -> BytesIO:
-        bg = self._center([self._hand_to_images(player.hand) for player in self.players])
+    @classmethod
+    def render(cls, hands: List[List[Card]], image_format: str = "png", **save_options) -> BytesIO:
+        bg = cls._center([cls._hand_to_images(hand) for hand in hands])
         output_buffer = BytesIO()
-        bg.save(output_buffer, "png")
+        bg.save(output_buffer, image_format, **save_options)
         output_buffer.seek(0)
         return output_buffer
 
-    async def _out_table(self, interaction: discord.Interaction, title: str, description: str = "",
-                         view: discord.ui.View = None) -> None:
+    def _get_output(self) -> BytesIO:
+        return self.render([player.hand for player in self.players])
+
+    async def _render_table(self) -> Optional[discord.File]:
         get_output_func = functools.partial(self._get_output)
-        output_buffer = await self.interaction.client.loop.run_in_executor(None, get_output_func)
+        metrics = self.interaction.client.metrics
+        with span("render"), metrics.timer("cryptomc_backend", backend="renderer", op="blackjack"):
+            output_buffer = await self.interaction.client.renderer.render(get_output_func)
 
+        if output_buffer is None:
+            return None
+
+        return discord.File(fp=output_buffer, filename="blackjack_endmc.png")
+
+    async def _out_table(self, interaction: discord.Interaction, title: str, description: str = "",
+                         view: discord.ui.View = None) -> None:
         player = self.players[0]
         dealer = self.players[1]
 
@@ -191,36 +309,66 @@ class BlackjackGame:
             timestamp=discord.utils.utcnow()
         )
         blackjack_embed.set_footer(text=f"{self.interaction.user}", icon_url=self.interaction.user.display_avatar)
-        blackjack_embed.set_image(url=f"attachment://blackjack_endmc.png")
 
-        if view:
-            await interaction.response.send_message(
-                embed=blackjack_embed, file=discord.File(fp=output_buffer, filename="blackjack_endmc.png"), view=view
-            )
+        final = view is None
+        if final:
+            view = static_view(replay_button("blackjack_replay", self.interaction.user.id, self.bet_amount))
+
+        files = []
+        if final or not self.interaction.client.config.get("blackjack_final_table_only", False):
+            # The message keeps its attachment when it is edited without new ones.
+            frame = tuple(tuple(card.image for card in participant.hand) for participant in self.players)
+            if frame != self.frame:
+                table = await self._render_table()
+                if table is not None:
+                    files.append(table)
+                self.frame = frame if table is not None else ()
+
+            if self.frame:
+                blackjack_embed.set_image(url=f"attachment://blackjack_endmc.png")
+                self.interaction.client.metrics.inc("cryptomc_blackjack_frames_total", uploaded=bool(files))
+            else:
+                blackjack_embed.description += "\n\n*La table n'a pas pu être affichée, le serveur est surchargé.*"
+
+        if not final:
+            await self._save()
+
+        # The game starts with a new message, which every turn then edits.
+        if not self.started:
+            self.started = True
+            await send(interaction, embed=blackjack_embed, files=files, view=view)
+        elif files or not self.frame:
+            await edit(interaction, embed=blackjack_embed, attachments=files, view=view)
         else:
-            await interaction.response.send_message(
-                embed=blackjack_embed,
-                file=discord.File(fp=output_buffer, filename="blackjack_endmc.png"),
-                view=BlackjackReplay(self.interaction.user.id, self.bet_amount)
-            )
+            await edit(interaction, embed=blackjack_embed, view=view)
 
     async def _process_result(self, interaction: discord.Interaction, result: Tuple[str, Result]) -> None:
+        await self._discard()
+
         if result[1] == Result.WON:
             await self.interaction.client.mongo.update_user_data_document(
-                self.interaction.user.id, {"$inc": {"bank": self.bet_amount * 2, "blackjack_won": 1}}
+                self.interaction.user.id, {"$inc": {"bank": self.bet_amount * 2, "blackjack_won": 1}},
+                self.interaction.guild_id
             )
             desc = f"Vous gagnez **{self.bet_amount * 2}** {self.interaction.client.config['coin']}."
         elif result[1] == Result.LOST:
             await self.interaction.client.mongo.update_user_data_document(
-                self.interaction.user.id, {"$inc": {"blackjack_lost": 1}}
+                self.interaction.user.id, {"$inc": {"blackjack_lost": 1}}, self.interaction.guild_id
             )
             desc = f"Vous perdez **{self.bet_amount}** {self.interaction.client.config['coin']}."
         else:
             await self.interaction.client.mongo.update_user_data_document(
-                self.interaction.user.id, {"$inc": {"bank": self.bet_amount}}
+                self.interaction.user.id, {"$inc": {"bank": self.bet_amount}}, self.interaction.guild_id
             )
             desc = "Vous ne perdez pas votre argent."
 
+        # The bet was logged when the game started, the payout is logged here.
+        payout = {Result.WON: self.bet_amount * 2, Result.LOST: 0}.get(result[1], self.bet_amount)
+        self.interaction.client.events.log(
+            "game", self.interaction.user.id, payout, game="blackjack", won=result[1] == Result.WON,
+            guild_id=self.interaction.guild_id
+        )
+
         await self._out_table(interaction, result[0], description=desc)
 
     async def process_turn(self, interaction: discord.Interaction, action: Action = None):
@@ -265,13 +413,20 @@ class BlackjackGame:
         await self._out_table(
             interaction,
             "À vous de jouer",
-            view=PlayBlackjackView(self),
+            view=static_view(
+                button("blackjack_hit", self.id, self.turn, label="Tirer", emoji="➕"),
+                button("blackjack_stay", self.id, self.turn, label="Rester", emoji="❌")
+            ),
         )
 
     async def start(self):
         # Removing the amount bet.
         await self.interaction.client.mongo.update_user_data_document(
-            self.interaction.user.id, {"$inc": {"bank": -self.bet_amount}}
+            self.interaction.user.id, {"$inc": {"bank": -self.bet_amount}}, self.interaction.guild_id
+        )
+        # Logged now, an abandoned game never reaches its result.
+        self.interaction.client.events.log(
+            "bet", self.interaction.user.id, -self.bet_amount, game="blackjack", guild_id=self.interaction.guild_id
         )
 
         # Creating our players.
@@ -291,3 +446,44 @@ class BlackjackGame:
         dealer.add_card(self.deck.pop().flip())
 
         await self.process_turn(self.interaction)
+
+
+""" Component handlers. """
+
+
+async def _play(interaction: discord.Interaction, game_id: str, turn: str, action: Action) -> None:
+    redis = interaction.client.redis
+    key = BlackjackGame.KEY.format(game_id)
+
+    with interaction.client.metrics.timer("cryptomc_backend", backend="redis", op="blackjack_load"):
+        data = await redis.get(key)
+    if data is None:
+        return await send(interaction, "Cette partie de blackjack est terminée.", ephemeral=True)
+
+    game = BlackjackGame.load(interaction, int(game_id), ujson.loads(data))
+    if interaction.user.id != game.user_id or int(turn) != game.turn:
+        return await send(interaction, "Ce boutton ne vous cible pas.", ephemeral=True)
+
+    # Claims the turn, so a second click on the same button is refused even when another process receives it.
+    if not await redis.set(f"{key}:{turn}", 1, nx=True, ex=BlackjackGame.TIMEOUT):
+        return await send(interaction, "Ce boutton ne vous cible pas.", ephemeral=True)
+
+    game.turn += 1
+
+    await game.process_turn(interaction, action)
+
+
+async def hit(interaction: discord.Interaction, game_id: str, turn: str) -> None:
+    await _play(interaction, game_id, turn, Action.HIT)
+
+
+async def stay(interaction: discord.Interaction, game_id: str, turn: str) -> None:
+    await _play(interaction, game_id, turn, Action.STAY)
+
+
+async def replay(interaction: discord.Interaction, author_id: str, amount: str) -> None:
+    if interaction.user.id != int(author_id):
+        return await send(interaction, "Ce boutton ne vous cible pas.", ephemeral=True)
+
+    blackjack_command = interaction.client.tree.get_command("blackjack")
+    await blackjack_command.callback(interaction.client.get_cog("Games"), interaction, int(amount))
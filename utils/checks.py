@@ -5,6 +5,7 @@ import discord
 from discord import app_commands
 
 from utils.errors import CommandOnCooldown
+from utils.tracing import span
 
 
 class CooldownType(Enum):
@@ -13,21 +14,31 @@ class CooldownType(Enum):
 
 def cooldown(cooldown_type: CooldownType, per: int):
     async def predicate(interaction: discord.Interaction) -> bool:
-        cooldown_id = None
-        if cooldown_type == CooldownType.USER:
-            cooldown_id = interaction.user.id
+        with span("cooldown"):
+            return await _check_cooldown(interaction, cooldown_type, per)
 
-        fmt = f"{cooldown_type.value}:{cooldown_id}:{interaction.command.name}"
+    return app_commands.check(predicate)
+
+
+async def _check_cooldown(interaction: discord.Interaction, cooldown_type: CooldownType, per: int) -> bool:
+    cooldown_id = None
+    if cooldown_type == CooldownType.USER:
+        cooldown_id = interaction.user.id
+
+    fmt = f"{cooldown_type.value}:{cooldown_id}:{interaction.command.name}"
+    if interaction.client.guild_scoped:
+        # Each guild has its own economy, so its own cooldowns.
+        fmt = f"{interaction.guild_id}:{fmt}"
+    with interaction.client.metrics.timer("cryptomc_backend", backend="redis", op="cooldown_read"):
         result = await interaction.client.redis.hget("cryptomc_cooldowns", fmt)
-        if result:
-            retry_after = datetime.datetime.fromtimestamp(float(result)) - datetime.datetime.utcnow()
-            raise CommandOnCooldown(cooldown_type, retry_after.total_seconds())
+    if result:
+        retry_after = datetime.datetime.fromtimestamp(float(result)) - datetime.datetime.utcnow()
+        raise CommandOnCooldown(cooldown_type, retry_after.total_seconds())
 
-        cooldown_end = datetime.datetime.utcnow() + datetime.timedelta(seconds=per)
+    cooldown_end = datetime.datetime.utcnow() + datetime.timedelta(seconds=per)
+    with interaction.client.metrics.timer("cryptomc_backend", backend="redis", op="cooldown_write"):
         await interaction.client.redis.hset("cryptomc_cooldowns", fmt, str(cooldown_end.timestamp()))
         # Requires KeyDB.
         await interaction.client.redis.execute_command("EXPIREMEMBER", *["cryptomc_cooldowns", fmt, per])
 
-        return False if result else True
-
-    return app_commands.check(predicate)
+    return False if result else True
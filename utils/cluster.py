@@ -0,0 +1,146 @@
+"""Cluster mode: several processes, each connected to a range of the shards.
+
+The processes share their state through Redis: the cooldowns, the live blackjack games and the presence. One of them
+is elected leader with a lease in Redis and runs the singleton tasks, such as picking the presence or the rollups.
+The launcher starts the processes and restarts the ones that exit:
+
+    python -m utils.cluster --processes 4
+    python -m utils.cluster --processes 4 --shards 16
+"""
+import argparse
+import asyncio
+import multiprocessing
+import time
+from typing import List, Optional
+
+import aiohttp
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+from utils.config import load_config
+from utils.metrics import Metrics
+
+# Discord accepts one identify every 5 seconds per bucket, the processes are started accordingly.
+IDENTIFY_DELAY = 5.0
+
+
+class Leadership:
+    """A lease in Redis held by at most one process of the cluster, renewed every third of its duration."""
+
+    KEY = "cryptomc_leader"
+
+    # Compare-and-act, the lease may expire and be taken by another process between a GET and the next command.
+    RENEW_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('expire', KEYS[1], ARGV[2]) " \
+                   "else return 0 end"
+    RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+    def __init__(self, redis: aioredis.Redis, metrics: Metrics, cluster_id: int, ttl: int = 30):
+        self.redis = redis
+        self.metrics = metrics
+        self.cluster_id = str(cluster_id)
+        self.ttl = ttl
+
+        self.leader = False
+
+    async def _renew(self) -> bool:
+        if await self.redis.set(self.KEY, self.cluster_id, nx=True, ex=self.ttl):
+            return True
+
+        return bool(await self.redis.eval(self.RENEW_SCRIPT, 1, self.KEY, self.cluster_id, self.ttl))
+
+    async def run(self) -> None:
+        while True:
+            try:
+                self.leader = await self._renew()
+            except RedisError:
+                self.leader = False
+
+            self.metrics.set("cryptomc_cluster_leader", int(self.leader))
+            await asyncio.sleep(self.ttl / 3)
+
+    async def release(self) -> None:
+        """Gives the lease up so another process takes over without waiting for it to expire."""
+        if self.leader:
+            await self.redis.eval(self.RELEASE_SCRIPT, 1, self.KEY, self.cluster_id)
+        self.leader = False
+
+
+def shard_ranges(shard_count: int, processes: int) -> List[List[int]]:
+    """Splits the shards into `processes` contiguous ranges of nearly equal size."""
+    processes = max(1, min(processes, shard_count))
+    size, extra = divmod(shard_count, processes)
+
+    ranges = []
+    start = 0
+    for cluster_id in range(processes):
+        end = start + size + (1 if cluster_id < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+
+    return ranges
+
+
+async def fetch_shard_count(token: str) -> int:
+    """Returns the number of shards recommended by Discord."""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            "https://discord.com/api/v10/gateway/bot", headers={"Authorization": f"Bot {token}"}
+        ) as response:
+            response.raise_for_status()
+            return (await response.json())["shards"]
+
+
+def _run_cluster(cluster_id: int, shard_ids: List[int], shard_count: int) -> None:
+    from cryptomc import CryptoMC
+
+    bot = CryptoMC(cluster_id=cluster_id, shard_ids=shard_ids, shard_count=shard_count)
+    bot.run(bot.config["bot_token"])
+
+
+def main() -> None:
+    config = load_config()
+
+    parser = argparse.ArgumentParser(description="Run the bot as a cluster of processes.")
+    parser.add_argument("--processes", type=int, default=config.get("cluster", {}).get("processes", 2))
+    parser.add_argument("--shards", type=int, default=None, help="defaults to the count recommended by Discord")
+    args = parser.parse_args()
+
+    shard_count: Optional[int] = args.shards
+    if shard_count is None:
+        shard_count = asyncio.run(fetch_shard_count(config["bot_token"]))
+
+    ranges = shard_ranges(shard_count, args.processes)
+    context = multiprocessing.get_context("spawn")
+
+    def start(cluster_id: int) -> multiprocessing.Process:
+        process = context.Process(
+            target=_run_cluster, args=(cluster_id, ranges[cluster_id], shard_count), name=f"cluster-{cluster_id}"
+        )
+        process.start()
+        print(f"Cluster {cluster_id} started with the shards {ranges[cluster_id]} (PID {process.pid}).")
+        return process
+
+    workers = {}
+    try:
+        for cluster_id in range(len(ranges)):
+            workers[cluster_id] = start(cluster_id)
+            if cluster_id < len(ranges) - 1:
+                time.sleep(IDENTIFY_DELAY * len(ranges[cluster_id]))
+
+        while True:
+            time.sleep(IDENTIFY_DELAY)
+            for cluster_id, process in workers.items():
+                if not process.is_alive():
+                    print(f"Cluster {cluster_id} exited with the code {process.exitcode}, restarting it.")
+                    workers[cluster_id] = start(cluster_id)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in workers.values():
+            process.terminate()
+        for process in workers.values():
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+from typing import Any, Awaitable, Callable, Dict
+
+import discord
+
+from utils.responder import arm, close
+
+PREFIX = "cmc"
+
+Handler = Callable[..., Awaitable[Any]]
+
+
+def custom_id(route: str, *args: Any) -> str:
+    """Encodes a route and its arguments in a component custom_id."""
+    return ":".join([PREFIX, route, *map(str, args)])
+
+
+def button(route: str, *args: Any, label: str, emoji: str,
+           style: discord.ButtonStyle = discord.ButtonStyle.gray) -> discord.ui.Button:
+    return discord.ui.Button(label=label, emoji=emoji, style=style, custom_id=custom_id(route, *args))
+
+
+def replay_button(route: str, *args: Any) -> discord.ui.Button:
+    return button(route, *args, label="Rejouer", emoji="🔁", style=discord.ButtonStyle.blurple)
+
+
+def static_view(*items: discord.ui.Item) -> discord.ui.View:
+    """Builds a view only used to send its components, their clicks are handled by the ComponentDispatcher."""
+    view = discord.ui.View(timeout=None)
+    for item in items:
+        view.add_item(item)
+
+    # A finished view is not stored by discord.py, so nothing is kept per message.
+    view.stop()
+    return view
+
+
+class ComponentDispatcher:
+    """Routes every component interaction to its handler from its custom_id.
+
+    The custom_id holds everything the handler needs, so the buttons keep working across restarts and no View or
+    timeout task is kept for the messages they are attached to.
+    """
+
+    def __init__(self):
+        self.routes: Dict[str, Handler] = {}
+
+    def register(self, route: str, handler: Handler) -> None:
+        self.routes[route] = handler
+
+    def unregister(self, route: str) -> None:
+        self.routes.pop(route, None)
+
+    async def dispatch(self, interaction: discord.Interaction) -> None:
+        if interaction.type != discord.InteractionType.component:
+            return
+
+        prefix, _, data = interaction.data.get("custom_id", "").partition(":")
+        route, *args = data.split(":")
+        if prefix != PREFIX or route not in self.routes:
+            return
+
+        recorder = interaction.client.recorder
+        recorder.start(interaction, route)
+        arm(interaction)
+        try:
+            await self.routes[route](interaction, *args)
+        except Exception as e:
+            recorder.finish(interaction, e)
+            await interaction.client.tree.on_error(interaction, e)
+        else:
+            recorder.finish(interaction)
+        finally:
+            close(interaction)
@@ -0,0 +1,10 @@
+import functools
+import json
+from typing import Any, Dict
+
+
+@functools.lru_cache(maxsize=None)
+def load_config(path: str = "config.json") -> Dict[str, Any]:
+    """Reads the configuration once, every later call returns the same dict."""
+    with open(path, "r") as fic:
+        return dict(json.load(fic))
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, Optional, TYPE_CHECKING
+
+from pymongo import monitoring
+
+from utils.metrics import Metrics
+from utils.startup import startup_report
+
+if TYPE_CHECKING:
+    import motor.motor_asyncio
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Exports the utilization and the checkout wait time of the MongoDB connection pools."""
+
+    def __init__(self, metrics: Metrics, max_pool_size: int):
+        self.metrics = metrics
+        self.max_pool_size = max_pool_size
+
+        self.lock = threading.Lock()
+        self.connections: Dict[str, int] = {}
+        self.checked_out: Dict[str, int] = {}
+
+    @staticmethod
+    def _address(address) -> str:
+        return f"{address[0]}:{address[1]}"
+
+    def _add(self, counts: Dict[str, int], gauge: str, address, amount: int) -> None:
+        key = self._address(address)
+        with self.lock:
+            counts[key] = max(0, counts.get(key, 0) + amount)
+            value = counts[key]
+        self.metrics.set(gauge, value, address=key)
+
+    def pool_created(self, event: monitoring.PoolCreatedEvent) -> None:
+        self.metrics.set("cryptomc_mongo_pool_max_size", self.max_pool_size, address=self._address(event.address))
+
+    def pool_ready(self, event: monitoring.PoolReadyEvent) -> None:
+        pass
+
+    def pool_cleared(self, event: monitoring.PoolClearedEvent) -> None:
+        self.metrics.inc("cryptomc_mongo_pool_cleared_total")
+
+    def pool_closed(self, event: monitoring.PoolClosedEvent) -> None:
+        pass
+
+    def connection_created(self, event: monitoring.ConnectionCreatedEvent) -> None:
+        self._add(self.connections, "cryptomc_mongo_pool_connections", event.address, 1)
+
+    def connection_ready(self, event: monitoring.ConnectionReadyEvent) -> None:
+        pass
+
+    def connection_closed(self, event: monitoring.ConnectionClosedEvent) -> None:
+        self._add(self.connections, "cryptomc_mongo_pool_connections", event.address, -1)
+
+    def connection_check_out_started(self, event: monitoring.ConnectionCheckOutStartedEvent) -> None:
+        pass
+
+    def connection_check_out_failed(self, event: monitoring.ConnectionCheckOutFailedEvent) -> None:
+        self.metrics.inc("cryptomc_mongo_pool_checkout_failures_total", reason=event.reason)
+
+    def connection_checked_out(self, event: monitoring.ConnectionCheckedOutEvent) -> None:
+        self._add(self.checked_out, "cryptomc_mongo_pool_checked_out", event.address, 1)
+
+        # The wait time is only reported by PyMongo 4.7 and later.
+        duration = getattr(event, "duration", None)
+        if duration is not None:
+            self.metrics.observe("cryptomc_mongo_pool_wait_seconds", duration)
+
+    def connection_checked_in(self, event: monitoring.ConnectionCheckedInEvent) -> None:
+        self._add(self.checked_out, "cryptomc_mongo_pool_checked_out", event.address, -1)
+
+
+def create_client(config: Dict[str, Any], metrics: Optional[Metrics] = None) -> motor.motor_asyncio.AsyncIOMotorClient:
+    """Creates the Motor client with the pool options of `mongodb_options` in config.json."""
+    motor_asyncio = startup_report.import_module("motor.motor_asyncio")
+
+    options = dict(config.get("mongodb_options", {}))
+    if metrics is not None:
+        options["event_listeners"] = [PoolStats(metrics, options.get("maxPoolSize", 100))]
+
+    return motor_asyncio.AsyncIOMotorClient(config["mongodb_uri"], **options)
@@ -0,0 +1,95 @@
+import asyncio
+import datetime
+from typing import Any, Dict, List, Optional
+
+from pymongo.errors import BulkWriteError, PyMongoError
+from redis import asyncio as aioredis
+
+from utils.metrics import Metrics
+
+
+class EventLog:
+    """The economy events waiting to be written to MongoDB, in batches.
+
+    It belongs to the bot rather than to the Events cog, so the events logged while the cog is reloaded or unloaded
+    are kept. Each process publishes the timestamp of its oldest waiting event in Redis, the rollups stop before it.
+    """
+
+    BATCH_SIZE = 500
+
+    # Events kept while MongoDB is unavailable, the oldest ones are dropped beyond it.
+    MAX_BUFFER = 50_000
+
+    DUPLICATE_KEY = 11000
+
+    PENDING_KEY = "cryptomc_events_pending"
+
+    # A process which stopped publishing no longer holds the rollups back once its marker expired.
+    PENDING_TTL = 60
+
+    def __init__(self, db, redis: aioredis.Redis, metrics: Metrics, cluster_id: int):
+        self.db = db
+        self.redis = redis
+        self.metrics = metrics
+        self.cluster_id = str(cluster_id)
+
+        self.buffer: List[Dict[str, Any]] = []
+
+    def log(self, kind: str, user_id: int, amount: int, game: Optional[str] = None, won: Optional[bool] = None,
+            target_id: Optional[int] = None, guild_id: Optional[int] = None) -> None:
+        """Appends an event, `amount` being the change of the user's balance."""
+        self.buffer.append({
+            "ts": datetime.datetime.utcnow(),
+            "meta": {"kind": kind, "game": game, "guild_id": str(guild_id) if guild_id is not None else None},
+            "user_id": str(user_id),
+            "target_id": str(target_id) if target_id is not None else None,
+            "amount": amount,
+            "won": won
+        })
+
+        if len(self.buffer) >= self.BATCH_SIZE:
+            asyncio.ensure_future(self.write())
+
+    async def write(self) -> None:
+        if not self.buffer:
+            return
+
+        batch, self.buffer = self.buffer, []
+        try:
+            with self.metrics.timer("cryptomc_backend", backend="mongo", op="insert_events"):
+                await self.db["events"].insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # The other events of the batch were written, an event already written is not retried.
+            failed = {
+                error["index"] for error in e.details.get("writeErrors", []) if error["code"] != self.DUPLICATE_KEY
+            }
+            self._requeue([event for index, event in enumerate(batch) if index in failed])
+        except PyMongoError:
+            self._requeue(batch)
+
+    def _requeue(self, batch: List[Dict[str, Any]]) -> None:
+        self.buffer = batch + self.buffer
+        if len(self.buffer) > self.MAX_BUFFER:
+            self.metrics.inc("cryptomc_events_dropped_total", len(self.buffer) - self.MAX_BUFFER)
+            self.buffer = self.buffer[-self.MAX_BUFFER:]
+
+    def _oldest(self) -> datetime.datetime:
+        # Two failed batches may be requeued out of order, the buffer is not sorted.
+        return min(event["ts"] for event in self.buffer)
+
+    async def publish_pending(self) -> None:
+        """Publishes the timestamp of the oldest waiting event, for the rollups of the leader."""
+        if not self.buffer:
+            await self.redis.hdel(self.PENDING_KEY, self.cluster_id)
+            return
+
+        await self.redis.hset(self.PENDING_KEY, self.cluster_id, self._oldest().isoformat())
+        await self.redis.execute_command("EXPIREMEMBER", self.PENDING_KEY, self.cluster_id, self.PENDING_TTL)
+
+    async def oldest_pending(self) -> Optional[datetime.datetime]:
+        """Returns the timestamp of the oldest event still waiting to be written by any process."""
+        pending = [datetime.datetime.fromisoformat(ts) for ts in await self.redis.hvals(self.PENDING_KEY)]
+        if self.buffer:
+            pending.append(self._oldest())
+
+        return min(pending, default=None)
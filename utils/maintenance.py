@@ -0,0 +1,173 @@
+"""Streaming migrations of the user collection.
+
+Each migration walks the matching documents in `_id` order with a cursor, applies its writes with batched
+`bulk_write` calls and saves its progress in the `maintenance` collection after every batch, so an interrupted run
+resumes where it stopped. It can be run by the owner with `;;migrate <name>` or from the command line:
+
+    python -m utils.maintenance backfill --batch-size 500
+
+The `partition` migration moves the users of the single-guild layout into the guild `guild_id` of config.json,
+before switching `economy_scope` to `guild`. It only moves string ids, `fix_id` must be run first.
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from utils.config import load_config
+from utils.database import create_client
+
+ProgressCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+STRING_IDS = {"_id": {"$type": "string"}}
+OTHER_IDS = {"_id": {"$not": {"$type": "string"}}}
+UNPARTITIONED = {"_id": {"$type": "string"}, "guild_id": {"$exists": False}}
+
+DUPLICATE_KEY = 11000
+
+
+def _backfill(document: Dict[str, Any], defaults: Dict[str, Any], guild_id: int) -> List[Any]:
+    missing = {key: value for key, value in defaults.items() if key != "_id" and key not in document}
+    return [UpdateOne({"_id": document["_id"]}, {"$set": missing})] if missing else []
+
+
+def _fix_id(document: Dict[str, Any], defaults: Dict[str, Any], guild_id: int) -> List[Any]:
+    # Merges the document into the one keyed by the string id that the bot reads, then removes it. The target records
+    # the merged ids and is not matched by them again, so a batch interrupted before its deletes can be run again:
+    # the upsert then fails with a duplicate key, which `_bulk_write` ignores.
+    counters = {
+        key: value for key, value in document.items() if key != "_id" and isinstance(value, (int, float))
+    }
+    operations = [UpdateOne(
+        {"_id": str(document["_id"]), "merged_ids": {"$nin": [document["_id"]]}},
+        {"$inc": counters, "$addToSet": {"merged_ids": document["_id"]}},
+        upsert=True
+    )] if counters else []
+    return operations + [DeleteOne({"_id": document["_id"]})]
+
+
+def _reset_balances(document: Dict[str, Any], defaults: Dict[str, Any], guild_id: int) -> List[Any]:
+    return [UpdateOne({"_id": document["_id"]}, {"$set": {"bank": defaults["bank"]}})]
+
+
+def _partition(document: Dict[str, Any], defaults: Dict[str, Any], guild_id: int) -> List[Any]:
+    # The replaces of a batch are sent in one bulk write and its deletes in a second one. A batch interrupted between
+    # the two is simply run again: a replace, unlike an insert, can be repeated.
+    partitioned = dict(document, _id=f"{guild_id}:{document['_id']}", guild_id=str(guild_id), user_id=document["_id"])
+    return [ReplaceOne({"_id": partitioned["_id"]}, partitioned, upsert=True), DeleteOne({"_id": document["_id"]})]
+
+
+MIGRATIONS = {
+    "backfill": (STRING_IDS, _backfill),
+    "fix_id": (OTHER_IDS, _fix_id),
+    "reset_balances": (STRING_IDS, _reset_balances),
+    "partition": (UNPARTITIONED, _partition),
+}
+
+
+async def _bulk_write(collection, operations: List[Any]) -> int:
+    """Applies the operations in one unordered bulk write, and returns the number of documents written."""
+    if not operations:
+        return 0
+
+    try:
+        result = await collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        if any(error["code"] != DUPLICATE_KEY for error in e.details.get("writeErrors", [])):
+            raise
+        return e.details.get("nModified", 0) + e.details.get("nUpserted", 0) + e.details.get("nRemoved", 0)
+
+    return result.modified_count + result.upserted_count + result.deleted_count
+
+
+async def run_migration(db, name: str, defaults: Dict[str, Any], guild_id: int, batch_size: int = 500,
+                        restart: bool = False, progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+    """Runs a migration on the user collection and returns its final progress."""
+    query, migrate = MIGRATIONS[name]
+
+    checkpoint = None if restart else await db["maintenance"].find_one({"_id": name, "done": False})
+    if checkpoint is not None:
+        query = {"$and": [query, {"_id": {"$gt": checkpoint["last_id"]}}]}
+        state = {"processed": checkpoint["processed"], "written": checkpoint["written"]}
+    else:
+        state = {"processed": 0, "written": 0}
+
+    state.update({"migration": name, "rate": 0.0, "done": False})
+    start = time.perf_counter()
+    processed_at_start = state["processed"]
+
+    async def write_batch(operations: List[Any], last_id: Any) -> None:
+        # PyMongo sends a new command whenever the type of operation changes, so the deletes are sent together
+        # after every other write of the batch, which they must not precede.
+        deletes = [operation for operation in operations if isinstance(operation, DeleteOne)]
+        writes = [operation for operation in operations if not isinstance(operation, DeleteOne)]
+        state["written"] += await _bulk_write(db["user"], writes)
+        state["written"] += await _bulk_write(db["user"], deletes)
+
+        state["rate"] = (state["processed"] - processed_at_start) / (time.perf_counter() - start)
+        await db["maintenance"].update_one(
+            {"_id": name},
+            {"$set": {"last_id": last_id, "processed": state["processed"], "written": state["written"],
+                      "done": False}},
+            upsert=True
+        )
+        if progress is not None:
+            await progress(state)
+
+    operations: List[Any] = []
+    count = 0
+    last_id = None
+    async for document in db["user"].find(query, sort=[("_id", 1)], batch_size=batch_size):
+        operations.extend(migrate(document, defaults, guild_id))
+        last_id = document["_id"]
+        state["processed"] += 1
+        count += 1
+
+        if count == batch_size:
+            await write_batch(operations, last_id)
+            operations = []
+            count = 0
+
+    if count:
+        await write_batch(operations, last_id)
+
+    state["done"] = True
+    await db["maintenance"].update_one({"_id": name}, {"$set": {"done": True}}, upsert=True)
+    if progress is not None:
+        await progress(state)
+
+    return state
+
+
+def format_progress(state: Dict[str, Any]) -> str:
+    status = "terminée" if state["done"] else "en cours"
+    return f"Migration `{state['migration']}` {status}: {state['processed']} documents parcourus, " \
+           f"{state['written']} modifiés ({state['rate']:.0f} documents/s)."
+
+
+async def _main() -> None:
+    from cogs.mongodb import MongoDB
+
+    parser = argparse.ArgumentParser(description="Run a migration on the user collection.")
+    parser.add_argument("migration", choices=list(MIGRATIONS))
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--restart", action="store_true", help="ignore the progress of an interrupted run")
+    parser.add_argument("--guild-id", type=int, default=None, help="guild of the partition, defaults to guild_id")
+    args = parser.parse_args()
+
+    async def progress(state: Dict[str, Any]) -> None:
+        print(format_progress(state))
+
+    config = load_config()
+    db = create_client(config)["cryptomc"]
+    await run_migration(
+        db, args.migration, MongoDB.DEFAULT_USER_DATA, args.guild_id or config["guild_id"], args.batch_size,
+        args.restart, progress
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -3,6 +3,8 @@ from typing import Union
 import discord
 from discord.ext.menus.views import ViewMenuPages
 
+from utils.responder import send
+
 
 class InteractionViewMenu(ViewMenuPages):
 
@@ -16,15 +18,9 @@ class InteractionViewMenu(ViewMenuPages):
         kwargs = await self._get_kwargs_from_page(page)
         view = self.build_view()
         if view:
-            if interaction.response.is_done():
-                await interaction.followup.send(**kwargs, view=view)
-            else:
-                await interaction.response.send_message(**kwargs, view=view)
+            await send(interaction, **kwargs, view=view)
         else:
-            if interaction.response.is_done():
-                await interaction.followup.send(**kwargs)
-            else:
-                await interaction.response.send_message(**kwargs)
+            await send(interaction, **kwargs)
         return await interaction.original_response()
 
     async def start(self, interaction: discord.Interaction, *,
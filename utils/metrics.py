@@ -0,0 +1,133 @@
+import bisect
+import contextlib
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# For the histograms of sizes rather than durations.
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Metrics:
+    """In-memory counters, gauges and histograms, rendered in the Prometheus text format.
+
+    Thread-safe, the MongoDB pool events are reported from the driver's threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.gauges: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+
+    @staticmethod
+    def _labels(labels: Dict[str, object]) -> Labels:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        key = self._labels(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels) -> None:
+        key = self._labels(labels)
+        with self.lock:
+            self.gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, **labels) -> None:
+        key = self._labels(labels)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """Observes the duration of the block in `<name>_seconds` and counts its exceptions in `<name>_errors_total`."""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.inc(f"{name}_errors_total", error=type(e).__name__, **labels)
+            raise
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - start, **labels)
+
+    """ Prometheus exposition. """
+
+    @staticmethod
+    def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(labels) + ([extra] if extra else [])
+        if not pairs:
+            return ""
+
+        escaped = [
+            f'{key}="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+            for key, value in pairs
+        ]
+        return "{" + ",".join(escaped) + "}"
+
+    def render(self) -> str:
+        with self.lock:
+            return self._render()
+
+    def _render(self) -> str:
+        lines: List[str] = []
+
+        for kind, metrics in (("counter", self.counters), ("gauge", self.gauges)):
+            for name, series in sorted(metrics.items()):
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in series.items():
+                    lines.append(f"{name}{self._format_labels(labels)} {value}")
+
+        for name, series in sorted(self.histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._format_labels(labels, ('le', str(bound)))} {cumulative}")
+                lines.append(f"{name}_bucket{self._format_labels(labels, ('le', '+Inf'))} {histogram.count}")
+                lines.append(f"{name}_sum{self._format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{self._format_labels(labels)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+async def start_server(metrics: Metrics, host: str, port: int) -> web.AppRunner:
+    """Serves the metrics on `http://<host>:<port>/metrics`."""
+
+    async def handle(_: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
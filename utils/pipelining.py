@@ -0,0 +1,76 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from redis import asyncio as aioredis
+
+from utils.metrics import Metrics, SIZE_BUCKETS
+
+# Commands which block the connection or change its state, they are never batched.
+UNBATCHED = {"BLPOP", "BRPOP", "BLMOVE", "BZPOPMIN", "BZPOPMAX", "XREAD", "XREADGROUP", "SUBSCRIBE", "PSUBSCRIBE",
+             "MONITOR", "WATCH", "MULTI", "EXEC", "SELECT"}
+
+
+class AutoPipeline(aioredis.Redis):
+    """A Redis client sending the commands issued during one iteration of the loop together, in one pipeline.
+
+    Every command method goes through `execute_command`, which queues the command and returns once the pipeline
+    holding it was answered. A failing command only fails its caller.
+    """
+
+    def __init__(self, metrics: Metrics, **kwargs):
+        super().__init__(**kwargs)
+        self.metrics = metrics
+
+        self.pending: List[Tuple[Tuple[Any, ...], Dict[str, Any], asyncio.Future]] = []
+        self.flush_handle: Optional[asyncio.Handle] = None
+
+    @classmethod
+    def create(cls, metrics: Metrics, url: str, **kwargs) -> "AutoPipeline":
+        return cls(metrics, connection_pool=aioredis.ConnectionPool.from_url(url, **kwargs))
+
+    async def execute_command(self, *args, **options) -> Any:
+        if str(args[0]).upper() in UNBATCHED:
+            return await super().execute_command(*args, **options)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((args, options, future))
+        if self.flush_handle is None:
+            # Runs after the callbacks already scheduled, which may issue more commands.
+            self.flush_handle = loop.call_soon(self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        self.flush_handle = None
+        batch, self.pending = self.pending, []
+        asyncio.ensure_future(self._send(batch))
+
+    async def _send(self, batch: List[Tuple[Tuple[Any, ...], Dict[str, Any], asyncio.Future]]) -> None:
+        self.metrics.observe("cryptomc_redis_batch_size", len(batch), buckets=SIZE_BUCKETS)
+        self.metrics.inc("cryptomc_redis_round_trips_total")
+        self.metrics.inc("cryptomc_redis_commands_total", len(batch))
+
+        try:
+            if len(batch) == 1:
+                args, options, _ = batch[0]
+                results = [await super().execute_command(*args, **options)]
+            else:
+                pipeline = self.pipeline(transaction=False)
+                for args, options, _ in batch:
+                    pipeline.execute_command(*args, **options)
+                results = await pipeline.execute(raise_on_error=False)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
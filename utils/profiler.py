@@ -0,0 +1,110 @@
+import asyncio
+import collections
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional
+
+# Threads of the default loop executor and of the render pool.
+PROFILED_THREAD_PREFIXES = ("asyncio_", "render")
+
+
+class SamplingProfiler:
+    """Samples the stacks of the event loop and of the executor threads, and flags event loop stalls."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, interval: float = 0.005, stall_threshold: float = 0.25):
+        self.loop = loop
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+
+        self.samples: Dict[str, int] = collections.Counter()
+        self.stalls: List[Dict[str, object]] = []
+
+        self._loop_thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._stopping = threading.Event()
+        self._last_beat = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(stack))
+
+    async def _heartbeat(self) -> None:
+        while True:
+            self._last_beat = time.monotonic()
+            await asyncio.sleep(self.stall_threshold / 4)
+
+    def _run(self) -> None:
+        stall: Optional[Dict[str, object]] = None
+
+        while not self._stopping.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self._loop_thread_id:
+                    label = "event_loop"
+                elif names.get(thread_id, "").startswith(PROFILED_THREAD_PREFIXES):
+                    label = names[thread_id]
+                else:
+                    continue
+
+                self.samples[f"{label};{self._collapse(frame)}"] += 1
+
+            blocked_for = time.monotonic() - self._last_beat
+            if blocked_for > self.stall_threshold:
+                if stall is None:
+                    frame = sys._current_frames().get(self._loop_thread_id)
+                    stall = {
+                        "started_at": time.time() - blocked_for,
+                        "duration": blocked_for,
+                        "stack": "".join(traceback.format_stack(frame)) if frame is not None else ""
+                    }
+                    self.stalls.append(stall)
+                    print(f"Event loop blocked for more than {self.stall_threshold * 1000:.0f}ms:\n{stall['stack']}")
+                else:
+                    stall["duration"] = blocked_for
+            else:
+                stall = None
+
+    def start(self) -> None:
+        """Starts profiling, must be called from the event loop thread."""
+        self.samples.clear()
+        self.stalls.clear()
+
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopping.clear()
+        self._heartbeat_task = self.loop.create_task(self._heartbeat())
+
+        self._thread = threading.Thread(target=self._run, name="cryptomc-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self, path: str) -> int:
+        """Stops profiling and writes the collapsed stacks to `path` and the stalls to `<path>.stalls.json`."""
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+        self._heartbeat_task.cancel()
+        self._heartbeat_task = None
+
+        with open(path, "w") as fic:
+            for stack, count in sorted(self.samples.items()):
+                fic.write(f"{stack} {count}\n")
+
+        with open(f"{path}.stalls.json", "w") as fic:
+            json.dump(self.stalls, fic, indent=2)
+
+        return sum(self.samples.values())
@@ -0,0 +1,76 @@
+import ast
+import hashlib
+import os
+from typing import Dict, Iterable, List, Set
+
+PACKAGES = ("utils", "cogs")
+
+
+def module_hashes(root: str = ".") -> Dict[str, str]:
+    """Returns the content hash of every module of the utils and cogs packages."""
+    hashes = {}
+    for package in PACKAGES:
+        for filename in os.listdir(os.path.join(root, package)):
+            if filename.endswith(".py"):
+                with open(os.path.join(root, package, filename), "rb") as fic:
+                    hashes[f"{package}.{filename[:-3]}"] = hashlib.sha1(fic.read()).hexdigest()
+
+    return hashes
+
+
+def module_dependencies(modules: Iterable[str], root: str = ".") -> Dict[str, Set[str]]:
+    """Returns the utils modules imported by each module."""
+    dependencies = {}
+    for module in modules:
+        with open(os.path.join(root, *module.split(".")) + ".py", "rb") as fic:
+            tree = ast.parse(fic.read())
+
+        # Imports only made for type checkers do not bind anything at runtime.
+        type_checking = {
+            id(child) for node in ast.walk(tree)
+            if isinstance(node, ast.If) and isinstance(node.test, ast.Name) and node.test.id == "TYPE_CHECKING"
+            for child in ast.walk(node)
+        }
+
+        imported = set()
+        for node in ast.walk(tree):
+            if id(node) in type_checking:
+                continue
+
+            if isinstance(node, ast.Import):
+                imported.update(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module == "utils":
+                imported.update(f"utils.{alias.name}" for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module:
+                imported.add(node.module)
+
+        dependencies[module] = {name for name in imported if name.startswith("utils.") and name != module}
+
+    return dependencies
+
+
+def reload_order(changed: Set[str], dependencies: Dict[str, Set[str]]) -> List[str]:
+    """Returns the changed modules and the modules depending on them, each one after its dependencies."""
+    affected = set(changed)
+    while True:
+        dependents = {module for module, imported in dependencies.items() if imported & affected} - affected
+        if not dependents:
+            break
+        affected |= dependents
+
+    order: List[str] = []
+    visited: Set[str] = set()
+
+    def visit(module: str) -> None:
+        if module in visited:
+            return
+        visited.add(module)
+        for dependency in sorted(dependencies.get(module, ())):
+            if dependency in affected:
+                visit(dependency)
+        order.append(module)
+
+    for module in sorted(affected):
+        visit(module)
+
+    return order
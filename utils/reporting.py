@@ -0,0 +1,126 @@
+import hashlib
+import logging
+import logging.handlers
+import os
+import queue
+import traceback
+from typing import Dict, List, Optional
+
+from utils.metrics import Metrics
+
+
+class ErrorGroup:
+
+    def __init__(self, fingerprint: str, summary: str, location: str):
+        self.fingerprint = fingerprint
+        self.summary = summary
+        self.location = location
+
+        self.count = 0
+        self.contexts: List[str] = []
+
+
+class ErrorReporter:
+    """Groups the unexpected errors by fingerprint, for digests sent to the owner with their occurrence counts.
+
+    `report` never blocks: the full tracebacks are handed to a queue, which a thread writes to a rotating file.
+    """
+
+    # Contexts (commands) kept per error group for the digest.
+    KEEP_CONTEXTS = 3
+
+    def __init__(self, metrics: Metrics, path: str = "errors.log", max_bytes: int = 5_000_000, backup_count: int = 3):
+        self.metrics = metrics
+        self.path = path
+        self.groups: Dict[str, ErrorGroup] = {}
+        # The counts of the groups in the last digest, forgotten once it was delivered.
+        self.digested: Dict[str, int] = {}
+
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True
+        )
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.listener = logging.handlers.QueueListener(self.queue, handler)
+        self.running = False
+
+        self.logger = logging.getLogger("cryptomc.errors")
+        self.logger.propagate = False
+        self.logger.handlers = [logging.handlers.QueueHandler(self.queue)]
+
+    def start(self) -> None:
+        self.listener.start()
+        self.running = True
+
+    def stop(self) -> None:
+        if self.running:
+            self.listener.stop()
+            self.running = False
+
+    @staticmethod
+    def fingerprint(error: BaseException) -> str:
+        """Identifies an error by its type and the functions of its stack, line numbers aside."""
+        frames = traceback.extract_tb(error.__traceback__)
+        parts = [f"{type(error).__module__}.{type(error).__qualname__}"]
+        parts += [f"{os.path.basename(frame.filename)}:{frame.name}" for frame in frames]
+        return hashlib.sha1("|".join(parts).encode()).hexdigest()[:10]
+
+    def report(self, error: BaseException, context: str) -> str:
+        fingerprint = self.fingerprint(error)
+
+        group = self.groups.get(fingerprint)
+        if group is None:
+            frames = traceback.extract_tb(error.__traceback__)
+            location = f"{os.path.basename(frames[-1].filename)}:{frames[-1].lineno}" if frames else "?"
+            group = self.groups[fingerprint] = ErrorGroup(
+                fingerprint, "".join(traceback.format_exception_only(type(error), error)).strip(), location
+            )
+
+        group.count += 1
+        if context not in group.contexts:
+            group.contexts = (group.contexts + [context])[-self.KEEP_CONTEXTS:]
+
+        self.metrics.inc("cryptomc_errors_total", error=type(error).__name__)
+        self.logger.error(
+            f"[{fingerprint}] {context}\n"
+            + "".join(traceback.format_exception(type(error), error, error.__traceback__)).rstrip()
+        )
+        return fingerprint
+
+    def digest(self, limit: int = 1900) -> Optional[str]:
+        """Returns the errors reported since the previous delivered digest, the most frequent first.
+
+        They are kept until `acknowledge` is called, a digest which could not be sent is included in the next one.
+        """
+        if not self.groups:
+            return None
+
+        groups = sorted(self.groups.values(), key=lambda group: group.count, reverse=True)
+        self.digested = {group.fingerprint: group.count for group in groups}
+
+        lines = []
+        length = 0
+        for index, group in enumerate(groups):
+            line = f"**{group.count}x** `{group.summary[:200]}` à `{group.location}` " \
+                   f"(`{group.fingerprint}`, {', '.join(group.contexts)})"
+            if length + len(line) > limit:
+                lines.append(f"... et {len(groups) - index} autres erreurs.")
+                break
+            lines.append(line)
+            length += len(line) + 1
+
+        lines.append(f"Les traces complètes sont dans `{self.path}`.")
+        return "\n".join(lines)
+
+    def acknowledge(self) -> None:
+        """Forgets the errors of the last digest, once delivered. The errors reported since remain."""
+        for fingerprint, count in self.digested.items():
+            group = self.groups.get(fingerprint)
+            if group is None:
+                continue
+
+            group.count -= count
+            if group.count <= 0:
+                del self.groups[fingerprint]
+
+        self.digested = {}
@@ -0,0 +1,96 @@
+import asyncio
+from typing import Optional
+
+import discord
+
+from utils.tracing import span
+
+DEFAULT_BUDGET = 2.0
+
+
+class Responder:
+    """Answers an interaction, deferring it when its response budget runs out.
+
+    Discord drops interactions that are not acknowledged within 3 seconds of their creation. The responder defers the
+    interaction once `response_budget` seconds have elapsed without a response, and the following sends and edits go
+    through the followup webhook instead.
+    """
+
+    def __init__(self, interaction: discord.Interaction, budget: float):
+        self.interaction = interaction
+        self.lock = asyncio.Lock()
+
+        elapsed = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+        self._handle: Optional[asyncio.TimerHandle] = interaction.client.loop.call_later(
+            max(0.0, budget - elapsed), self._schedule_defer
+        )
+
+    @classmethod
+    def of(cls, interaction: discord.Interaction) -> "Responder":
+        responder = interaction.extras.get("responder")
+        if responder is None:
+            budget = interaction.client.config.get("response_budget", DEFAULT_BUDGET)
+            responder = interaction.extras["responder"] = cls(interaction, budget)
+
+        return responder
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _schedule_defer(self) -> None:
+        self._handle = None
+        self.interaction.client.loop.create_task(self._defer())
+
+    async def _defer(self) -> None:
+        async with self.lock:
+            if self.interaction.response.is_done():
+                return
+
+            # Slash commands show a "thinking" message replaced by the first followup, buttons edit their message.
+            thinking = self.interaction.type == discord.InteractionType.application_command
+            try:
+                await self.interaction.response.defer(thinking=thinking)
+            except discord.HTTPException:
+                return
+
+            command = self.interaction.command.qualified_name if self.interaction.command else "component"
+            self.interaction.client.metrics.inc("cryptomc_interactions_deferred_total", command=command)
+
+    async def send(self, *args, **kwargs) -> None:
+        self.close()
+        async with self.lock:
+            with span("send"):
+                if self.interaction.response.is_done():
+                    await self.interaction.followup.send(*args, **kwargs)
+                else:
+                    await self.interaction.response.send_message(*args, **kwargs)
+
+    async def edit(self, **kwargs) -> None:
+        self.close()
+        async with self.lock:
+            with span("send"):
+                if self.interaction.response.is_done():
+                    await self.interaction.edit_original_response(**kwargs)
+                else:
+                    await self.interaction.response.edit_message(**kwargs)
+
+
+def arm(interaction: discord.Interaction) -> None:
+    """Starts the response budget of an interaction."""
+    Responder.of(interaction)
+
+
+def close(interaction: discord.Interaction) -> None:
+    responder = interaction.extras.get("responder")
+    if responder is not None:
+        responder.close()
+
+
+async def send(interaction: discord.Interaction, *args, **kwargs) -> None:
+    await Responder.of(interaction).send(*args, **kwargs)
+
+
+async def edit(interaction: discord.Interaction, **kwargs) -> None:
+    await Responder.of(interaction).edit(**kwargs)
@@ -0,0 +1,214 @@
+"""Snapshots of the economy for offline analysis.
+
+An export streams the `user` and `events` collections into a directory holding, for each of them, a gzipped NDJSON
+file of the documents and one raw little-endian int64 file per numeric column, which NumPy maps in memory without
+loading it. The owner can export with `;;snapshot`, and the command line both exports and analyses snapshots:
+
+    python -m utils.snapshot export --out snapshots
+    python -m utils.snapshot leaderboard snapshots/20240101T000000 -n 10 --guild 596978185422372866
+    python -m utils.snapshot stats snapshots/20240101T000000 bank
+"""
+import argparse
+import asyncio
+import datetime
+import gzip
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.config import load_config
+from utils.database import create_client
+
+DTYPE = "<i8"
+
+EVENT_COLUMNS = ["ts", "user_id", "amount"]
+
+# The ids of the guild-scoped documents, whose `_id` is "<guild_id>:<user_id>".
+PARTITION_COLUMNS = ["guild_id", "user_id"]
+
+
+def _to_int(value: Any) -> int:
+    if isinstance(value, datetime.datetime):
+        return int(value.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000)
+
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return -1
+
+
+class _TableWriter:
+
+    def __init__(self, directory: str, table: str, columns: List[str]):
+        self.directory = directory
+        self.table = table
+        self.columns = columns
+        self.count = 0
+
+        self.documents = gzip.open(os.path.join(directory, f"{table}.ndjson.gz"), "wt", encoding="utf-8")
+        self.column_files = {column: open(self._column_path(column), "wb") for column in columns}
+
+    def _column_path(self, column: str) -> str:
+        return os.path.join(self.directory, f"{self.table}.{column}.i64")
+
+    def write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        for document in batch:
+            self.documents.write(json.dumps(document, default=str) + "\n")
+
+        for column, fic in self.column_files.items():
+            np.array([_to_int(document.get(column)) for document in batch], dtype=DTYPE).tofile(fic)
+
+        self.count += len(batch)
+
+    def close(self) -> Dict[str, Any]:
+        self.documents.close()
+        for fic in self.column_files.values():
+            fic.close()
+
+        return {"count": self.count, "columns": self.columns}
+
+
+async def _export_table(db, collection: str, writer: _TableWriter, batch_size: int) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+
+    batch: List[Dict[str, Any]] = []
+    async for document in db[collection].find({}, batch_size=batch_size):
+        batch.append(document)
+        if len(batch) == batch_size:
+            await loop.run_in_executor(None, writer.write_batch, batch)
+            batch = []
+
+    if batch:
+        await loop.run_in_executor(None, writer.write_batch, batch)
+
+    return writer.close()
+
+
+async def export(db, user_columns: List[str], out: str = "snapshots", batch_size: int = 1000) -> str:
+    """Exports the user and events collections, and returns the snapshot directory."""
+    directory = os.path.join(out, datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S"))
+    os.makedirs(directory)
+
+    user_columns = user_columns + [column for column in PARTITION_COLUMNS if column not in user_columns]
+
+    manifest = {
+        "created_at": datetime.datetime.utcnow().isoformat(),
+        "dtype": DTYPE,
+        "tables": {
+            "user": await _export_table(db, "user", _TableWriter(directory, "user", user_columns), batch_size),
+            "events": await _export_table(
+                db, "events", _TableWriter(directory, "events", EVENT_COLUMNS), batch_size
+            )
+        }
+    }
+
+    with open(os.path.join(directory, "manifest.json"), "w") as fic:
+        json.dump(manifest, fic, indent=2)
+
+    return directory
+
+
+class Snapshot:
+    """A snapshot opened for analysis, its columns are memory-mapped."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, "manifest.json"), "r") as fic:
+            self.manifest = json.load(fic)
+
+    def column(self, table: str, column: str) -> np.ndarray:
+        if self.manifest["tables"][table]["count"] == 0:
+            return np.empty(0, dtype=self.manifest["dtype"])
+
+        return np.memmap(
+            os.path.join(self.directory, f"{table}.{column}.i64"), dtype=self.manifest["dtype"], mode="r"
+        )
+
+    def _has_column(self, table: str, column: str) -> bool:
+        return column in self.manifest["tables"][table]["columns"]
+
+    def user_ids(self) -> np.ndarray:
+        """Returns the user id of each user document, whichever the layout of its `_id`."""
+        ids = self.column("user", "_id")
+        if not self._has_column("user", "user_id"):
+            return ids
+
+        user_ids = self.column("user", "user_id")
+        return np.where(user_ids >= 0, user_ids, ids)
+
+    def leaderboard(self, limit: int = 10, guild_id: Optional[int] = None) -> List[Tuple[int, int]]:
+        ids = self.user_ids()
+        banks = self.column("user", "bank")
+
+        if guild_id is not None:
+            if not self._has_column("user", "guild_id"):
+                return []
+            selected = np.flatnonzero(self.column("user", "guild_id") == guild_id)
+            ids, banks = ids[selected], banks[selected]
+
+        limit = min(limit, len(banks))
+        if limit == 0:
+            return []
+
+        top = np.argpartition(banks, -limit)[-limit:]
+        top = top[np.argsort(banks[top])[::-1]]
+        return [(int(ids[index]), int(banks[index])) for index in top]
+
+    def distribution(self, column: str, table: str = "user") -> Dict[str, float]:
+        values = self.column(table, column)
+        if len(values) == 0:
+            return {"count": 0}
+
+        percentiles = np.percentile(values, [50, 90, 99])
+        return {
+            "count": int(len(values)),
+            "sum": int(values.sum()),
+            "mean": float(values.mean()),
+            "min": int(values.min()),
+            "p50": float(percentiles[0]),
+            "p90": float(percentiles[1]),
+            "p99": float(percentiles[2]),
+            "max": int(values.max())
+        }
+
+
+async def _export_from_config(out: str, batch_size: int) -> str:
+    from cogs.mongodb import MongoDB
+
+    db = create_client(load_config())["cryptomc"]
+    return await export(db, list(MongoDB.DEFAULT_USER_DATA), out, batch_size)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export and analyse snapshots of the economy.")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    export_parser = subparsers.add_parser("export")
+    export_parser.add_argument("--out", default="snapshots")
+    export_parser.add_argument("--batch-size", type=int, default=1000)
+
+    leaderboard_parser = subparsers.add_parser("leaderboard")
+    leaderboard_parser.add_argument("snapshot")
+    leaderboard_parser.add_argument("-n", type=int, default=10)
+    leaderboard_parser.add_argument("--guild", type=int, default=None, help="ranks the users of this guild only")
+
+    stats_parser = subparsers.add_parser("stats")
+    stats_parser.add_argument("snapshot")
+    stats_parser.add_argument("column")
+    stats_parser.add_argument("--table", default="user")
+
+    args = parser.parse_args()
+
+    if args.action == "export":
+        print(asyncio.run(_export_from_config(args.out, args.batch_size)))
+    elif args.action == "leaderboard":
+        for place, (user_id, bank) in enumerate(Snapshot(args.snapshot).leaderboard(args.n, args.guild), start=1):
+            print(f"{place}. {user_id} {bank:,}")
+    else:
+        print(json.dumps(Snapshot(args.snapshot).distribution(args.column, args.table), indent=2))
+
+
+if __name__ == "__main__":
+    main()
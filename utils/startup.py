@@ -0,0 +1,74 @@
+import builtins
+import contextlib
+import importlib
+import sys
+import time
+from types import ModuleType
+from typing import Iterator, List, Optional, Tuple
+
+
+class StartupReport:
+    """Timings of the cold start: imports, extension loads, setup_hook and time to ready."""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.timings: List[Tuple[str, str, float]] = []
+        self.ready_after: Optional[float] = None
+
+    @contextlib.contextmanager
+    def timed(self, kind: str, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings.append((kind, name, time.perf_counter() - start))
+
+    @contextlib.contextmanager
+    def timed_imports(self) -> Iterator[None]:
+        """Times each module imported by an import statement of the block, its own imports included.
+
+        Only meant for the module level of the entry point, which runs before any other thread.
+        """
+        original_import = builtins.__import__
+        depth = 0
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            nonlocal depth
+            if depth or level or name in sys.modules:
+                return original_import(name, globals, locals, fromlist, level)
+
+            depth += 1
+            try:
+                with self.timed("import", name):
+                    return original_import(name, globals, locals, fromlist, level)
+            finally:
+                depth -= 1
+
+        builtins.__import__ = timed_import
+        try:
+            yield
+        finally:
+            builtins.__import__ = original_import
+
+    def import_module(self, name: str) -> ModuleType:
+        """Imports a module on its first use, and times that first import."""
+        module = sys.modules.get(name)
+        if module is None:
+            with self.timed("import", name):
+                module = importlib.import_module(name)
+
+        return module
+
+    def ready(self) -> None:
+        self.ready_after = time.perf_counter() - self.started_at
+
+    def format(self) -> str:
+        lines = [f"{kind} {name}: {seconds * 1000:.1f}ms" for kind, name, seconds in self.timings]
+        if self.ready_after is not None:
+            lines.append(f"ready after {self.ready_after * 1000:.1f}ms")
+
+        return "\n".join(lines)
+
+
+# Created by the first import, which is the first statement of cryptomc.py.
+startup_report = StartupReport()
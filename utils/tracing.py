@@ -0,0 +1,105 @@
+import contextlib
+import contextvars
+import datetime
+import heapq
+import itertools
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import discord
+
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("cryptomc_trace", default=None)
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class Trace:
+    __slots__ = ("name", "user_id", "started_at", "start", "duration", "error", "spans")
+
+    def __init__(self, name: str, user_id: int):
+        self.name = name
+        self.user_id = user_id
+        self.started_at = datetime.datetime.utcnow()
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.error: Optional[str] = None
+        self.spans: List[Tuple[str, float, float]] = []
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "user_id": self.user_id,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 3),
+            "error": self.error,
+            "spans": [
+                {"phase": phase, "offset_ms": round(offset * 1000, 3), "duration_ms": round(duration * 1000, 3)}
+                for phase, offset, duration in self.spans
+            ]
+        }
+
+
+class _Span:
+    __slots__ = ("trace", "phase", "start")
+
+    def __init__(self, trace: Trace, phase: str):
+        self.trace = trace
+        self.phase = phase
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *_) -> None:
+        end = time.perf_counter()
+        self.trace.spans.append((self.phase, self.start - self.trace.start, end - self.start))
+
+
+def span(phase: str):
+    """Times a phase of the interaction being traced in the current task, and does nothing when none is."""
+    trace = _current_trace.get()
+    if trace is None:
+        return _NULL_SPAN
+
+    return _Span(trace, phase)
+
+
+class FlightRecorder:
+    """Keeps the slowest traced interactions with their phase breakdown."""
+
+    def __init__(self, enabled: bool = False, keep: int = 50):
+        self.enabled = enabled
+        self.keep = keep
+
+        self._slowest: List[Tuple[float, int, Trace]] = []
+        self._counter = itertools.count()
+
+    def start(self, interaction: discord.Interaction, name: str) -> None:
+        if not self.enabled:
+            return
+
+        trace = Trace(name, interaction.user.id)
+        interaction.extras["trace"] = trace
+        _current_trace.set(trace)
+
+    def finish(self, interaction: discord.Interaction, error: Exception = None) -> None:
+        trace = interaction.extras.pop("trace", None)
+        if trace is None:
+            return
+
+        trace.duration = time.perf_counter() - trace.start
+        if error is not None:
+            trace.error = type(error).__name__
+
+        entry = (trace.duration, next(self._counter), trace)
+        if len(self._slowest) < self.keep:
+            heapq.heappush(self._slowest, entry)
+        elif entry[0] > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    def dump(self, path: str) -> int:
+        traces = [trace.to_dict() for _, _, trace in sorted(self._slowest, reverse=True)]
+        with open(path, "w") as fic:
+            json.dump(traces, fic, indent=2)
+
+        return len(traces)